@@ -2,37 +2,32 @@ import json
 import argparse
 import sys
 
+import api_key_store
+
 def add_user_to_api_keys(filename, username, exchange, key, secret):
+    # The key store indexes api-keys.json by account and locks it, so concurrent signups don't overwrite each other
+    entry = {
+        "exchange": exchange,
+        "key": key,
+        "secret": secret
+    }
+
     try:
-        # Load the existing data
-        with open(filename, 'r') as file:
-            data = json.load(file)
+        added = api_key_store.add_api_key(username, entry, filename, api_key_store.KEYS_DB_FILE)
     except FileNotFoundError:
         print(f"Error: The file '{filename}' was not found.")
         sys.exit(400)
     except json.JSONDecodeError:
         print("Error: The file could not be decoded from JSON.")
         sys.exit(500)
+    except Exception as e:
+        print(f"Error: Failed to write to the file '{filename}'. {str(e)}")
+        sys.exit(505)
 
     # Check if the username already exists
-    if username in data:
+    if not added:
         print(f"Error: The username '{username}' already exists in the JSON data.")
         sys.exit(300)
-    
-    # Add the new user
-    data[username] = {
-        "exchange": exchange,
-        "key": key,
-        "secret": secret
-    }
-
-    # Save the updated data
-    try:
-        with open(filename, 'w') as file:
-            json.dump(data, file, indent=4)
-    except Exception as e:
-        print(f"Error: Failed to write to the file '{filename}'. {str(e)}")
-        sys.exit(505)
 
     print("Success")
 
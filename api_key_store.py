@@ -0,0 +1,118 @@
+import fcntl
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# api-keys.json stays the file passivbot reads; the store keeps the same entries indexed by account
+API_KEYS_FILE = '/home/stablesail/passivbot/api-keys.json'
+KEYS_DB_FILE = '/home/stablesail/botcode/api_keys.db'
+
+# How long a writer waits for another process holding the database
+BUSY_TIMEOUT_SECONDS = 10
+
+def connect(db_file):
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_SECONDS)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''CREATE TABLE IF NOT EXISTS api_keys (
+                        account_name TEXT PRIMARY KEY,
+                        exchange TEXT NOT NULL,
+                        entry TEXT NOT NULL,
+                        updated_at INTEGER NOT NULL
+                    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS store_meta (
+                        name TEXT PRIMARY KEY,
+                        value TEXT NOT NULL
+                    )''')
+    conn.commit()
+    return conn
+
+@contextmanager
+def file_lock(json_file):
+    # Serializes writers across processes: sync, change and export happen under one lock
+    with open(f'{json_file}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def file_signature(json_file):
+    stat = os.stat(json_file)
+    return f'{stat.st_mtime_ns}:{stat.st_size}'
+
+def synced_signature(conn):
+    row = conn.execute("SELECT value FROM store_meta WHERE name = 'file_signature'").fetchone()
+    return row[0] if row else None
+
+def record_signature(conn, json_file):
+    conn.execute('''INSERT INTO store_meta (name, value) VALUES ('file_signature', ?)
+                    ON CONFLICT(name) DO UPDATE SET value=excluded.value''', (file_signature(json_file),))
+
+def sync_from_file(conn, json_file):
+    # api-keys.json can still be edited by hand; when it differs from the last sync or export it wins
+    if file_signature(json_file) == synced_signature(conn):
+        return
+    with open(json_file, 'r') as file:
+        data = json.load(file)
+    now = int(time.time() * 1000)
+    with conn:
+        conn.execute('DELETE FROM api_keys')
+        conn.executemany('INSERT INTO api_keys (account_name, exchange, entry, updated_at) VALUES (?, ?, ?, ?)',
+                         [(account_name, entry.get('exchange', ''), json.dumps(entry), now) for account_name, entry in data.items()])
+        record_signature(conn, json_file)
+
+def export_api_keys(conn, json_file):
+    # Rebuilt in the order accounts were added and renamed into place, so passivbot never reads a partial file
+    data = {account_name: json.loads(entry) for account_name, entry in conn.execute('SELECT account_name, entry FROM api_keys ORDER BY rowid')}
+    temp_path = f'{json_file}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(data, file, indent=4)
+    os.replace(temp_path, json_file)
+    with conn:
+        record_signature(conn, json_file)
+
+def open_store(json_file=API_KEYS_FILE, db_file=KEYS_DB_FILE):
+    conn = connect(db_file)
+    if file_signature(json_file) != synced_signature(conn):
+        with file_lock(json_file):
+            sync_from_file(conn, json_file)
+    return conn
+
+def get_api_key(account_name, json_file=API_KEYS_FILE, db_file=KEYS_DB_FILE):
+    conn = open_store(json_file, db_file)
+    try:
+        row = conn.execute('SELECT entry FROM api_keys WHERE account_name = ?', (account_name,)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else None
+
+def load_api_keys(json_file=API_KEYS_FILE, db_file=KEYS_DB_FILE, account_name=None):
+    conn = open_store(json_file, db_file)
+    try:
+        if account_name:
+            rows = conn.execute('SELECT account_name, entry FROM api_keys WHERE account_name = ?', (account_name,))
+        else:
+            rows = conn.execute('SELECT account_name, entry FROM api_keys ORDER BY rowid')
+        return {name: json.loads(entry) for name, entry in rows}
+    finally:
+        conn.close()
+
+def add_api_key(account_name, entry, json_file=API_KEYS_FILE, db_file=KEYS_DB_FILE, replace=False):
+    # Returns False when the account already exists and replace is not set
+    conn = connect(db_file)
+    try:
+        with file_lock(json_file):
+            sync_from_file(conn, json_file)
+            exists = conn.execute('SELECT 1 FROM api_keys WHERE account_name = ?', (account_name,)).fetchone()
+            if exists and not replace:
+                return False
+            with conn:
+                conn.execute('''INSERT INTO api_keys (account_name, exchange, entry, updated_at) VALUES (?, ?, ?, ?)
+                                ON CONFLICT(account_name) DO UPDATE SET exchange=excluded.exchange, entry=excluded.entry, updated_at=excluded.updated_at''',
+                             (account_name, entry.get('exchange', ''), json.dumps(entry), int(time.time() * 1000)))
+            export_api_keys(conn, json_file)
+            return True
+    finally:
+        conn.close()
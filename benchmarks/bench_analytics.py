@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Time portfolio_analytics.py over synthetic fleets with a year of stored history
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_FOLDER))
+import portfolio_analytics
+import stablesail_db
+
+DEFAULT_FLEETS = (100, 1000, 2000)
+SNAPSHOTS_PER_DAY = 4
+TRADES_PER_DAY = 3
+COINS = [f'COIN{index}USDT' for index in range(40)]
+
+def create_fleet(db_file, accounts, days, now_ms):
+    # Uses the real schema from stablesail_db.init_db()
+    stablesail_db.maindb_file = db_file
+    db_conn = stablesail_db.init_db()
+    rng = np.random.default_rng(accounts)
+    first_ms = now_ms - days * portfolio_analytics.DAY_MS
+
+    snapshot_count = accounts * days * SNAPSHOTS_PER_DAY
+    snapshot_accounts = np.repeat(np.arange(accounts), days * SNAPSHOTS_PER_DAY)
+    snapshot_ts = first_ms + np.tile(np.arange(days * SNAPSHOTS_PER_DAY), accounts) * (portfolio_analytics.DAY_MS // SNAPSHOTS_PER_DAY)
+    snapshot_balances = 1000 + rng.normal(0, 20, snapshot_count).reshape(accounts, -1).cumsum(axis=1).ravel()
+    db_conn.executemany('INSERT INTO account_snapshots (account_name, ts, total_balance) VALUES (?, ?, ?)',
+                        zip((f'bench_{index:05d}' for index in snapshot_accounts.tolist()), snapshot_ts.tolist(), snapshot_balances.tolist()))
+
+    trade_count = accounts * days * TRADES_PER_DAY
+    trade_accounts = rng.integers(0, accounts, trade_count)
+    trade_ts = rng.integers(first_ms, now_ms, trade_count)
+    trade_coins = rng.integers(0, len(COINS), trade_count)
+    trade_pnl = rng.normal(0.5, 10, trade_count)
+    db_conn.executemany('INSERT INTO pnl_ledger (account_name, exchange, record_id, symbol, pnl, ts) VALUES (?, ?, ?, ?, ?, ?)',
+                        ((f'bench_{account:05d}', 'bybit', str(index), COINS[coin], pnl, ts)
+                         for index, (account, coin, pnl, ts) in enumerate(zip(trade_accounts.tolist(), trade_coins.tolist(), trade_pnl.tolist(), trade_ts.tolist()))))
+    db_conn.commit()
+    return db_conn
+
+def add_refresh_pass(db_conn, accounts, now_ms):
+    # What one refresh pass adds: a snapshot per account and a few new ledger records
+    db_conn.executemany('INSERT INTO account_snapshots (account_name, ts, total_balance) VALUES (?, ?, ?)',
+                        ((f'bench_{index:05d}', now_ms, 1000.0) for index in range(accounts)))
+    db_conn.executemany('INSERT INTO pnl_ledger (account_name, exchange, record_id, symbol, pnl, ts) VALUES (?, ?, ?, ?, ?, ?)',
+                        ((f'bench_{index:05d}', 'bybit', f'new_{index}', COINS[0], 1.0, now_ms) for index in range(0, accounts, 10)))
+    db_conn.commit()
+
+def time_analytics(db_conn, accounts, days, now_ms):
+    # The first pass folds the whole history into the daily tables; later passes only the rows added since
+    started = time.perf_counter()
+    portfolio_analytics.run_analytics(db_conn, days, now_ms)
+    first_pass = time.perf_counter() - started
+    add_refresh_pass(db_conn, accounts, now_ms)
+    started = time.perf_counter()
+    portfolio_analytics.run_analytics(db_conn, days, now_ms)
+    return first_pass, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure portfolio_analytics.py over synthetic fleets.')
+    parser.add_argument('--fleets', type=int, nargs='+', default=list(DEFAULT_FLEETS), help='Fleet sizes to run')
+    parser.add_argument('--days', type=int, default=portfolio_analytics.DEFAULT_DAYS, help='Days of history per account')
+    args = parser.parse_args()
+
+    now_ms = int(time.time() * 1000)
+    print(f"{'accounts':>8} {'first pass s':>13} {'next pass s':>12}")
+    for accounts in args.fleets:
+        with tempfile.TemporaryDirectory() as workdir:
+            db_conn = create_fleet(os.path.join(workdir, 'website_data.db'), accounts, args.days, now_ms)
+            first_pass, next_pass = time_analytics(db_conn, accounts, args.days, now_ms)
+            db_conn.close()
+        print(f'{accounts:>8} {first_pass:>13.2f} {next_pass:>12.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Offline benchmark of one stablesail_db.py refresh pass over synthetic account fleets
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPO_FOLDER = os.path.dirname(BENCHMARKS_FOLDER)
+sys.path.insert(0, os.path.join(REPO_FOLDER, 'mock_exchange'))
+
+import http_server
+from refresh_runner import RESULT_PREFIX
+
+DEFAULT_FLEETS = [10, 100, 1000]
+
+def write_fleet(workdir, size):
+    # Alternate exchanges so both refresh paths are measured
+    api_keys = {}
+    for index in range(size):
+        exchange = 'binance' if index % 2 == 0 else 'bybit'
+        api_keys[f'bench_{exchange}_{index:05d}'] = {
+            'exchange': exchange,
+            'key': f'benchkey{index:05d}',
+            'secret': f'benchsecret{index:05d}',
+        }
+    with open(os.path.join(workdir, 'api-keys.json'), 'w') as file:
+        json.dump(api_keys, file)
+
+def run_fleet(server, size, refresh_args, real_limits):
+    with tempfile.TemporaryDirectory(prefix=f'bench_{size}_') as workdir:
+        write_fleet(workdir, size)
+        server.stats.reset()
+
+        command = [sys.executable, os.path.join(BENCHMARKS_FOLDER, 'refresh_runner.py'),
+                   '--workdir', workdir, '--mock_url', server.url] + (['--real_limits'] if real_limits else []) + refresh_args
+        started = time.perf_counter()
+        completed = subprocess.run(command, capture_output=True, text=True)
+        wall_time = time.perf_counter() - started
+
+        if completed.returncode != 0:
+            print(completed.stdout[-2000:], completed.stderr[-2000:], file=sys.stderr)
+            raise SystemExit(f'Refresh of {size} accounts failed with exit code {completed.returncode}')
+
+        peak_rss_kb = None
+        for line in completed.stdout.splitlines():
+            if line.startswith(RESULT_PREFIX):
+                peak_rss_kb = json.loads(line[len(RESULT_PREFIX):])['peak_rss_kb']
+
+        stats = server.stats.snapshot()
+        return {
+            'accounts': size,
+            'requests': stats['requests'],
+            'requests_per_account': stats['requests'] / size,
+            'bytes_transferred': stats['bytes_received'] + stats['bytes_sent'],
+            'bytes_per_account': (stats['bytes_received'] + stats['bytes_sent']) / size,
+            'wall_time_s': wall_time,
+            'peak_rss_mb': peak_rss_kb / 1024 if peak_rss_kb else None,
+            'by_endpoint': stats['by_endpoint'],
+            'unknown_endpoints': stats['unknown'],
+        }
+
+def print_report(results):
+    print(f"{'accounts':>8} {'requests':>9} {'req/acct':>9} {'KB/acct':>9} {'wall s':>8} {'peak RSS MB':>12}")
+    for result in results:
+        print(f"{result['accounts']:>8} {result['requests']:>9} {result['requests_per_account']:>9.2f} "
+              f"{result['bytes_per_account'] / 1024:>9.1f} {result['wall_time_s']:>8.2f} {result['peak_rss_mb'] or 0:>12.1f}")
+    for result in results:
+        if result['unknown_endpoints']:
+            print(f"Unrecorded endpoints at {result['accounts']} accounts: {result['unknown_endpoints']}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark stablesail_db.py against a local mock exchange.')
+    parser.add_argument('--fleets', type=int, nargs='+', default=DEFAULT_FLEETS, help='Fleet sizes to run')
+    parser.add_argument('--real_limits', action='store_true', help='Keep the exchange rate limits instead of lifting them')
+    parser.add_argument('--json', dest='json_file', help='Also write the results to this JSON file')
+    args, refresh_args = parser.parse_known_args()
+
+    server = http_server.start_server()
+    try:
+        results = [run_fleet(server, size, refresh_args, args.real_limits) for size in args.fleets]
+    finally:
+        server.shutdown()
+
+    print_report(results)
+    if args.json_file:
+        with open(args.json_file, 'w') as file:
+            json.dump(results, file, indent=4)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Cold-start latency of each botcode.py subcommand, next to the script it wraps
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPO_FOLDER = os.path.dirname(BENCHMARKS_FOLDER)
+
+sys.path.insert(0, REPO_FOLDER)
+from botcode import COMMANDS
+
+DEFAULT_RUNS = 10
+
+def time_command(command, runs):
+    # --help exits once the arguments are parsed, so this measures interpreter start and imports
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=REPO_FOLDER, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'min_ms': min(timings), 'median_ms': statistics.median(timings)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cold-start time of the botcode.py subcommands.')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='Runs per command')
+    parser.add_argument('--commands', nargs='+', choices=list(COMMANDS), default=list(COMMANDS), help='Subcommands to measure')
+    parser.add_argument('--json', dest='json_file', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = {'python': time_command([sys.executable, '-c', 'pass'], args.runs)}
+    for name in args.commands:
+        module_name, _ = COMMANDS[name]
+        results[name] = {
+            'botcode': time_command([sys.executable, 'botcode.py', name, '--help'], args.runs),
+            'script': time_command([sys.executable, f'{module_name}.py', '--help'], args.runs),
+        }
+
+    print(f"{'command':<10} {'botcode min':>12} {'median':>8} {'script min':>11} {'median':>8}")
+    print(f"{'python':<10} {results['python']['min_ms']:>12.1f} {results['python']['median_ms']:>8.1f}")
+    for name in args.commands:
+        botcode, script = results[name]['botcode'], results[name]['script']
+        print(f"{name:<10} {botcode['min_ms']:>12.1f} {botcode['median_ms']:>8.1f} {script['min_ms']:>11.1f} {script['median_ms']:>8.1f}")
+
+    if args.json_file:
+        with open(args.json_file, 'w') as file:
+            json.dump(results, file, indent=4)
+
+if __name__ == '__main__':
+    main()
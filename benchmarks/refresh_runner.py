@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import resource
+import sys
+
+# Runs one stablesail_db.py refresh pass against the mock exchange, with all files in a work folder
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_FOLDER)
+
+import exchange_http
+import market_cache
+import rate_limiter
+import stablesail_db
+
+RESULT_PREFIX = 'BENCH_RESULT '
+
+def point_at_mock(api_urls, mock_url):
+    # Keep each ccxt endpoint's path but send it to the mock server
+    for key, value in api_urls.items():
+        if isinstance(value, dict):
+            point_at_mock(value, mock_url)
+        elif isinstance(value, str) and value.startswith('https://'):
+            path = value.split('/', 3)[3] if value.count('/') >= 3 else ''
+            api_urls[key] = f'{mock_url}/{path}'.rstrip('/')
+
+def main():
+    parser = argparse.ArgumentParser(description='Run stablesail_db.py against the mock exchange server.')
+    parser.add_argument('--workdir', required=True, help='Folder holding api-keys.json, the database and output files')
+    parser.add_argument('--mock_url', required=True, help='Base URL of mock_exchange/http_server.py')
+    parser.add_argument('--real_limits', action='store_true', help='Keep the exchange rate limits instead of lifting them')
+    args, refresh_args = parser.parse_known_args()
+
+    stablesail_db.api_keys_file = os.path.join(args.workdir, 'api-keys.json')
+    stablesail_db.api_keys_db_file = os.path.join(args.workdir, 'api_keys.db')
+    stablesail_db.maindb_file = os.path.join(args.workdir, 'website_data.db')
+    stablesail_db.accounts_coins_file_template = os.path.join(args.workdir, '{username}_account_coins.json')
+    market_cache.CACHE_FOLDER = os.path.join(args.workdir, 'cache')
+    os.chdir(args.workdir)
+
+    exchange_http.BASE_URLS = {exchange_id: args.mock_url for exchange_id in exchange_http.BASE_URLS}
+    if not args.real_limits:
+        rate_limiter.IP_LIMITS = {exchange_id: (10 ** 9, 1) for exchange_id in rate_limiter.IP_LIMITS}
+        rate_limiter.DEFAULT_BYBIT_ENDPOINT_LIMIT = (10 ** 9, 1)
+
+    fetch_exchange_data = stablesail_db.fetch_exchange_data
+    def fetch_mock_exchange_data(api_keys, selected_account=None):
+        exchanges = fetch_exchange_data(api_keys, selected_account)
+        for _, exchange in exchanges:
+            point_at_mock(exchange.urls['api'], args.mock_url)
+        return exchanges
+    stablesail_db.fetch_exchange_data = fetch_mock_exchange_data
+
+    # Listed first so metrics paths given on the command line still win
+    metrics_args = ['--metrics_file', os.path.join(args.workdir, 'metrics', 'stablesail_db.prom'),
+                    '--summary_file', os.path.join(args.workdir, 'metrics', 'stablesail_db_summary.json')]
+    stablesail_db.main(metrics_args + refresh_args)
+
+    # ru_maxrss is in kilobytes on Linux
+    print(RESULT_PREFIX + json.dumps({'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+
+if __name__ == '__main__':
+    main()
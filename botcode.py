@@ -0,0 +1,39 @@
+import runpy
+import sys
+
+# Subcommand: (module, description). A module is only imported when its subcommand runs,
+# so each subcommand starts as fast as the script it wraps.
+COMMANDS = {
+    'db': ('stablesail_db', 'Refresh account balances, positions and PnL (stablesail_db.py)'),
+    'stream': ('stablesail_stream', 'Stream positions and balances over private websockets (stablesail_stream.py)'),
+    'validate': ('validate_api', 'Verify an API key for futures trading (validate_api.py)'),
+    'adduser': ('adduser', 'Add a user to the API keys file (adduser.py)'),
+    'config': ('userconfigmanager', 'Manage user configurations in config.yaml (userconfigmanager.py)'),
+    'coins': ('list_coins', 'List the coins of a user (list_coins.py)'),
+    'botconfig': ('botconfigmanager', 'Manage bot function configuration files (botconfigmanager.py)'),
+    'analytics': ('portfolio_analytics', 'Compute drawdown, daily PnL and per-coin PnL from stored history (portfolio_analytics.py)'),
+}
+
+def print_usage(file=sys.stdout):
+    print("usage: botcode.py <command> [arguments]\n\ncommands:", file=file)
+    for name, (_, description) in COMMANDS.items():
+        print(f"  {name:<10} {description}", file=file)
+    print("\nRun 'botcode.py <command> --help' for the arguments of a command.", file=file)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        sys.exit(0)
+    if argv[0] not in COMMANDS:
+        print(f"Error: Unknown command '{argv[0]}'.\n", file=sys.stderr)
+        print_usage(sys.stderr)
+        sys.exit(2)
+
+    module_name, _ = COMMANDS[argv[0]]
+    # Run the script as if it were started directly, with its own argument parsing and exit codes
+    sys.argv = [argv[0]] + argv[1:]
+    runpy.run_module(module_name, run_name='__main__', alter_sys=True)
+
+if __name__ == "__main__":
+    main()
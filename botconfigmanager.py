@@ -1,8 +1,14 @@
 import json
 import os
 import argparse
+import glob
 import sys
 
+BOT_FUNCTION_SUFFIX = '_bot_function.json'
+
+# Consolidated store of every user's parameters; kept up to date by every write once it exists
+STORE_FILE = './bot_functions.json'
+
 def create_default_user_config():
     return {
         "wallet risk": 1.0,
@@ -20,14 +26,15 @@ def create_default_user_config():
     }
 
 def get_user_config_path(username):
-    return f"./{username}_bot_function.json"
+    return f"./{username}{BOT_FUNCTION_SUFFIX}"
 
-def manage_user_config(username, parameter=None, value=None):
+def manage_user_config(username, parameter=None, value=None, store_path=None):
     path = get_user_config_path(username)
     if not os.path.exists(path):
         config = create_default_user_config()
         with open(path, 'w') as f:
             json.dump(config, f, indent=4)
+        update_store_entry(store_path, username, config)
         print("New user file created.")
         sys.exit(0)  # Exit code 0: Successful operation
     
@@ -39,6 +46,7 @@ def manage_user_config(username, parameter=None, value=None):
                 f.seek(0)
                 f.truncate()
                 json.dump(config, f, indent=4)
+                update_store_entry(store_path, username, config)
                 print("Configuration updated.")
                 sys.exit(0)  # Exit code 0: Successful operation
             elif parameter not in config:
@@ -50,15 +58,138 @@ def manage_user_config(username, parameter=None, value=None):
     print("No change needed.")
     sys.exit(1)  # Exit code 1: No change needed
 
+def show_user_config(username, config=None):
+    # config can be passed in by callers that already hold the file, like config_service.py
+    if config is None:
+        path = get_user_config_path(username)
+        if not os.path.exists(path):
+            print(f"Error: No configuration file for user '{username}'.")
+            sys.exit(4)  # Exit code 4: No configuration file
+        with open(path, 'r') as f:
+            config = json.load(f)
+    print(json.dumps(config, indent=4))
+    sys.exit(0)  # Exit code 0: Successful operation
+
+def parse_settings(settings):
+    # Format only; names are checked against each user's file and ranges after that, as for a single update
+    updates = {}
+    for setting in settings:
+        parameter, separator, value = setting.partition('=')
+        parameter = parameter.strip()
+        if not separator:
+            print(f"Error: Invalid setting '{setting}', expected parameter=value.")
+            sys.exit(5)  # Exit code 5: Invalid setting format
+        try:
+            value = float(value)
+        except ValueError:
+            print(f"Error: Invalid value '{value.strip()}' for '{parameter}'.")
+            sys.exit(5)  # Exit code 5: Invalid setting format
+        updates[parameter] = value
+    return updates
+
+def check_updates(configs, updates):
+    # Every pair is checked against every selected file before any file is touched
+    for parameter, value in updates.items():
+        if any(parameter not in config for config in configs.values()):
+            print(f"Error: Invalid parameter name '{parameter}'.")
+            sys.exit(2)  # Exit code 2: Invalid parameter name
+    for parameter, value in updates.items():
+        if not 0 <= value <= 2:
+            print("Error: Value must be between 0 and 2.")
+            sys.exit(3)  # Exit code 3: Invalid value range
+
+def matching_users(pattern):
+    paths = glob.glob(get_user_config_path(pattern))
+    return sorted(os.path.basename(path)[:-len(BOT_FUNCTION_SUFFIX)] for path in paths)
+
+def write_json_atomically(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(temp_path, path)
+
+def rebuild_store(store_path):
+    # One file holding every user's parameters, so the bot can load the whole fleet in one read.
+    # Rebuilt from all configuration files, so users whose file was removed drop out of it.
+    store = {}
+    for username in matching_users('*'):
+        with open(get_user_config_path(username), 'r') as f:
+            store[username] = json.load(f)
+    write_json_atomically(store_path, store)
+
+def update_store_entry(store_path, username, config):
+    # Single-user writes only replace their own entry; without a store file yet, the first one builds it whole
+    if not store_path:
+        return
+    if not os.path.exists(store_path):
+        rebuild_store(store_path)
+        return
+    with open(store_path, 'r') as f:
+        store = json.load(f)
+    store[username] = config
+    write_json_atomically(store_path, dict(sorted(store.items())))
+
+def batch_update(usernames, settings, store_path=None):
+    updates = parse_settings(settings)
+
+    configs = {}
+    for username in usernames:
+        path = get_user_config_path(username)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                configs[username] = json.load(f)
+        else:
+            configs[username] = create_default_user_config()
+    check_updates(configs, updates)
+
+    changed = 0
+    for username, config in configs.items():
+        path = get_user_config_path(username)
+        new_config = {**config, **updates}
+        # Each file is written once, and only when something in it changes
+        if new_config != config or not os.path.exists(path):
+            write_json_atomically(path, new_config)
+            changed += 1
+
+    if store_path:
+        rebuild_store(store_path)
+    if not changed:
+        print("No change needed.")
+        sys.exit(1)  # Exit code 1: No change needed
+    print(f"Configuration updated for {changed} user(s).")
+    sys.exit(0)  # Exit code 0: Successful operation
+
 def main():
     parser = argparse.ArgumentParser(description="Manage Bot Function Configuration Files")
-    parser.add_argument('--user', type=str, required=True, help="Username for the configuration file")
+    parser.add_argument('--user', type=str, help="Username for the configuration file")
+    parser.add_argument('--users', type=str, help="Apply --set to every existing configuration file whose username matches this pattern, e.g. 'bot_*'")
     parser.add_argument('--parameter', type=str, help="Configuration parameter to update")
     parser.add_argument('--value', type=float, help="New value for the parameter (0 to 2)")
+    parser.add_argument('--set', dest='settings', action='append', default=[], metavar='PARAMETER=VALUE', help="Parameter to update in batch mode; can be given several times")
+    parser.add_argument('--store', type=str, help=f"Rebuild this consolidated JSON file from every configuration file; an existing {os.path.basename(STORE_FILE)} is always kept up to date")
+    parser.add_argument('--show', action='store_true', help="Print the user's configuration without changing it")
 
     args = parser.parse_args()
 
-    manage_user_config(args.user, args.parameter, args.value)
+    if bool(args.user) == bool(args.users):
+        parser.error("exactly one of --user and --users is required")
+    if (args.parameter is None) != (args.value is None) and (args.users or args.settings or args.store):
+        parser.error("--parameter and --value must be given together")
+    # In batch mode --parameter/--value is one more --set pair
+    settings = args.settings + ([f"{args.parameter}={args.value}"] if args.parameter is not None and args.value is not None else [])
+    # Any write keeps an existing default store current, so the bot never reads stale parameters
+    store_path = args.store or (STORE_FILE if os.path.exists(STORE_FILE) else None)
+    if args.users:
+        usernames = matching_users(args.users)
+        if not usernames:
+            print(f"Error: No configuration files match '{args.users}'.")
+            sys.exit(4)  # Exit code 4: No configuration file
+        batch_update(usernames, settings, store_path)
+    if args.show:
+        show_user_config(args.user)
+    if args.settings or args.store:
+        batch_update([args.user], settings, store_path)
+    manage_user_config(args.user, args.parameter, args.value, store_path)
 
 if __name__ == "__main__":
     main()
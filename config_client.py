@@ -0,0 +1,57 @@
+import argparse
+import json
+import socket
+import sys
+
+# Thin client for config_service.py; only the standard library is imported so it starts fast
+SOCKET_PATH = '/home/stablesail/botcode/config_service.sock'
+TIMEOUT_SECONDS = 5
+
+def query_service(socket_path, request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(TIMEOUT_SECONDS)
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode() + b'\n')
+        with client.makefile('rb') as response:
+            return json.loads(response.readline())
+
+def run_locally(request):
+    # Without the service the scripts themselves answer; they print and exit the same way
+    if request['command'] == 'list_coins':
+        import list_coins
+        list_coins.list_coins(request['account'])
+    elif request['command'] == 'list_users':
+        import userconfigmanager
+        userconfigmanager.list_users()
+    elif request['command'] == 'list_matching_users':
+        import userconfigmanager
+        userconfigmanager.list_matching_users(request['master_file_name'], show_missing=request['show_missing'])
+    elif request['command'] == 'bot_function':
+        import botconfigmanager
+        botconfigmanager.show_user_config(request['user'])
+    sys.exit(0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Query config_service.py, falling back to the scripts when it isn't running")
+    parser.add_argument('--socket', default=SOCKET_PATH, help="Unix socket of the config service")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list_coins', help="Same as list_coins.py -a ACCOUNT").add_argument('-a', '--account', required=True, help="Account name")
+    subparsers.add_parser('list_users', help="Same as userconfigmanager.py --list_users")
+    matching_parser = subparsers.add_parser('list_matching_users', help="Same as userconfigmanager.py --list_matching_users")
+    matching_parser.add_argument('-m', '--master_file_name', default='master.yaml', help="Master YAML file name")
+    matching_parser.add_argument('--show_missing', action='store_true', help="Same as userconfigmanager.py --show_missing")
+    subparsers.add_parser('bot_function', help="Same as botconfigmanager.py --user USER --show").add_argument('--user', required=True, help="Username")
+    args = parser.parse_args()
+
+    request = {key: value for key, value in vars(args).items() if key != 'socket'}
+    try:
+        answer = query_service(args.socket, request)
+    except (OSError, ValueError):
+        run_locally(request)
+
+    sys.stdout.write(answer['stdout'])
+    sys.stderr.write(answer['stderr'])
+    sys.exit(answer['code'])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import copy
+import hashlib
+import marshal
+import os
+import stat
+import sys
+
+import yaml
+
+# libyaml's C loader and dumper when PyYAML was built with it, the pure-Python ones otherwise
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# Parsed YAML files are cached here, keyed by path, modification time and size.
+# marshal is not safe against crafted data either, so the folder is owner-only (0700) and files
+# owned by anyone else are ignored; nobody but this user can put a cache file in front of the loader.
+CACHE_FOLDER = '/home/stablesail/botcode/cache/config'
+
+# Parsed data per path in this process, so one command never parses the same file twice
+_parsed = {}
+
+# Whether CACHE_FOLDER can be used, checked once per process
+_cache_folder_ready = {}
+
+def cache_folder_ready():
+    # Created owner-only; an existing folder must be a real directory owned by this user, and is closed to others
+    ready = _cache_folder_ready.get(CACHE_FOLDER)
+    if ready is None:
+        try:
+            os.makedirs(CACHE_FOLDER, mode=0o700, exist_ok=True)
+            folder_stat = os.lstat(CACHE_FOLDER)
+            ready = stat.S_ISDIR(folder_stat.st_mode) and folder_stat.st_uid == os.getuid()
+            if ready and folder_stat.st_mode & 0o077:
+                os.chmod(CACHE_FOLDER, 0o700)
+            ready = ready and os.access(CACHE_FOLDER, os.W_OK)
+        except OSError:
+            ready = False
+        _cache_folder_ready[CACHE_FOLDER] = ready
+    return ready
+
+def cache_path(file_path):
+    name = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()
+    return os.path.join(CACHE_FOLDER, f'config_{name}.marshal')
+
+def file_key(file_path):
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+def read_cache(key):
+    # Returns the marshalled data cached for this key, None when there's no valid entry
+    if not cache_folder_ready():
+        return None
+    try:
+        with open(cache_path(key[0]), 'rb') as file:
+            if os.fstat(file.fileno()).st_uid != os.getuid():
+                return None
+            cached = marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(cached, tuple) or len(cached) != 2 or cached[0] != key or not isinstance(cached[1], bytes):
+        return None
+    return cached[1]
+
+def write_cache(key, dumped, warn=True):
+    # Write to a temp file and rename so other processes never read a partial cache.
+    # Reads pass warn=False: a cache that can't be used only costs parsing time, not worth a warning per command.
+    if not cache_folder_ready():
+        if warn:
+            print(f"Warning: config cache folder '{CACHE_FOLDER}' is not usable; files are parsed on every read.", file=sys.stderr)
+        return
+    path = cache_path(key[0])
+    try:
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            marshal.dump((key, dumped), file)
+        os.replace(temp_path, path)
+    except OSError as e:
+        if warn:
+            print(f"Warning: could not write config cache '{path}': {e}", file=sys.stderr)
+
+def remember(key, data):
+    # Returns the marshalled data, or None for YAML marshal can't hold (such as timestamps), which isn't cached on disk
+    try:
+        dumped = marshal.dumps(data)
+    except ValueError:
+        _parsed[key[0]] = (key, None, data)
+        return None
+    _parsed[key[0]] = (key, dumped, None)
+    return dumped
+
+def parsed_copy(parsed):
+    return marshal.loads(parsed[1]) if parsed[1] is not None else copy.deepcopy(parsed[2])
+
+def read_yaml(file_path):
+    # Callers get their own copy, so changing the result never touches the caches
+    try:
+        key = file_key(file_path)
+        parsed = _parsed.get(key[0])
+        if parsed and parsed[0] == key:
+            return parsed_copy(parsed)
+
+        dumped = read_cache(key)
+        if dumped is None:
+            with open(file_path, 'r') as file:
+                data = yaml.load(file, Loader=SafeLoader)
+            dumped = remember(key, data)
+            if dumped is not None:
+                write_cache(key, dumped, warn=False)
+        else:
+            _parsed[key[0]] = (key, dumped, None)
+        return parsed_copy(_parsed[key[0]])
+    except FileNotFoundError:
+        print(f"Error: File '{file_path}' not found.", file=sys.stderr)
+        sys.exit(1)
+    except yaml.YAMLError as e:
+        print(f"Error parsing YAML file '{file_path}': {e}", file=sys.stderr)
+        sys.exit(2)
+
+def write_yaml(data, file_path):
+    # Write to a temp file and rename so readers never see a partial file
+    try:
+        temp_path = f'{file_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as file:
+            yaml.dump(data, file, Dumper=SafeDumper, sort_keys=False)
+        os.replace(temp_path, file_path)
+    except Exception as e:
+        print(f"Error writing to '{file_path}': {e}", file=sys.stderr)
+        sys.exit(3)
+
+    # The data just written is what the next read would parse
+    try:
+        key = file_key(file_path)
+    except OSError:
+        return
+    dumped = remember(key, data)
+    if dumped is not None:
+        write_cache(key, dumped)
@@ -0,0 +1,160 @@
+import argparse
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+from contextlib import redirect_stderr, redirect_stdout
+
+import botconfigmanager
+import list_coins
+import userconfigmanager
+from config_loader import read_yaml
+
+# Local socket the website's config queries are answered on
+SOCKET_PATH = '/home/stablesail/botcode/config_service.sock'
+
+# Largest request accepted, in bytes
+MAX_REQUEST_BYTES = 64 * 1024
+
+def file_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+class ConfigStore:
+    """Parsed config files and finished answers, refreshed when a file's mtime or size changes."""
+
+    def __init__(self, bot_function_folder):
+        self.bot_function_folder = bot_function_folder
+        self.files = {}
+        self.answers = {}
+
+    def load(self, path, parse):
+        key = file_key(path)
+        cached = self.files.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        data = parse(path)
+        self.files[path] = (key, data)
+        return data
+
+    def read_json(self, path):
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    def bot_function_path(self, username):
+        return os.path.join(self.bot_function_folder, botconfigmanager.get_user_config_path(username))
+
+    def query_files(self, command, args):
+        # The files an answer is computed from; a change to any of them invalidates it
+        if command == 'list_matching_users':
+            return [userconfigmanager.CONFIG_YAML, os.path.join(userconfigmanager.MASTER_YAML_FOLDER, args['master_file_name'])]
+        if command == 'bot_function':
+            return [self.bot_function_path(args['user'])]
+        return [list_coins.CONFIG_YAML if command == 'list_coins' else userconfigmanager.CONFIG_YAML]
+
+    def run(self, command, args):
+        # Runs the same functions as the command-line scripts, so output and exit codes match them
+        if command == 'list_coins':
+            list_coins.list_coins(args['account'], self.load(list_coins.CONFIG_YAML, read_yaml))
+        elif command == 'list_users':
+            userconfigmanager.list_users(self.load(userconfigmanager.CONFIG_YAML, read_yaml))
+        elif command == 'list_matching_users':
+            master_path = os.path.join(userconfigmanager.MASTER_YAML_FOLDER, args['master_file_name'])
+            userconfigmanager.list_matching_users(args['master_file_name'], self.load(userconfigmanager.CONFIG_YAML, read_yaml),
+                                                  self.load(master_path, read_yaml), args['show_missing'])
+        elif command == 'bot_function':
+            path = self.bot_function_path(args['user'])
+            botconfigmanager.show_user_config(args['user'], self.load(path, self.read_json) if os.path.exists(path) else None)
+
+    def answer(self, command, args):
+        keys = tuple(file_key(path) for path in self.query_files(command, args))
+        cache_key = (command, json.dumps(args, sort_keys=True))
+        cached = self.answers.get(cache_key)
+        if cached and cached[0] == keys:
+            return cached[1]
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        code = 0
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                self.run(command, args)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+        answer = {'code': code, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+        self.answers[cache_key] = (keys, answer)
+        return answer
+
+COMMAND_ARGS = {
+    'list_coins': ('account',),
+    'list_users': (),
+    'list_matching_users': ('master_file_name',),
+    'bot_function': ('user',),
+}
+
+# Optional true/false arguments; a request without one gets False
+COMMAND_FLAGS = {
+    'list_matching_users': ('show_missing',),
+}
+
+def parse_request(line):
+    try:
+        request = json.loads(line)
+        command = request['command']
+        args = {name: str(request[name]) for name in COMMAND_ARGS[command]}
+    except (ValueError, KeyError, TypeError):
+        return None, None
+    # Names become file names; keep them inside their folders
+    if any(os.sep in value or value.startswith('.') for value in args.values()):
+        return None, None
+    args.update({name: bool(request.get(name, False)) for name in COMMAND_FLAGS.get(command, ())})
+    return command, args
+
+class ConfigRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline(MAX_REQUEST_BYTES)
+        command, args = parse_request(line)
+        if command is None:
+            answer = {'code': 2, 'stdout': '', 'stderr': 'Error: Invalid request.\n'}
+        else:
+            answer = self.server.store.answer(command, args)
+        self.wfile.write(json.dumps(answer).encode() + b'\n')
+
+class ConfigServer(socketserver.UnixStreamServer):
+    # Requests are answered one at a time: the answers redirect sys.stdout, which is process-wide
+    def __init__(self, socket_path, store):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, ConfigRequestHandler)
+        os.chmod(socket_path, 0o660)
+        self.store = store
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer config queries from memory over a Unix socket")
+    parser.add_argument('--socket', default=SOCKET_PATH, help="Unix socket path to listen on")
+    parser.add_argument('--bot_function_folder', default='.', help="Folder holding the <username>_bot_function.json files")
+    args = parser.parse_args()
+
+    try:
+        server = ConfigServer(args.socket, ConfigStore(args.bot_function_folder))
+    except OSError as e:
+        print(f"Error: Could not listen on '{args.socket}': {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # Leave through the finally below on SIGTERM too, so the socket file is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Config service listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import hashlib
+import hmac
+import random
+import threading
+import time
+from urllib.parse import urlencode
+
+import rate_limiter
+from refresh_metrics import timed
+
+# Base URLs of the raw REST endpoints used alongside ccxt
+BASE_URLS = {
+    'binance': 'https://fapi.binance.com',
+    'bybit': 'https://api.bybit.com',
+}
+
+# Connect and read timeouts in seconds
+REQUEST_TIMEOUT = (5, 30)
+
+# Retry settings for rate limits, server errors and network failures
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30
+RETRY_STATUS_CODES = {418, 429, 500, 502, 503, 504}
+RETRY_BYBIT_RET_CODES = {10006}  # Too many visits
+
+# How long after its timestamp Bybit still accepts a signed request
+BYBIT_RECV_WINDOW_MS = 5000
+
+# Keep-alive connections kept per host, sized for the refresh worker pools
+POOL_SIZE = 32
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(base_url):
+    # requests is imported on first use so commands that never reach an exchange start faster
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            session = requests.Session()
+            session.mount(base_url, HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+            _sessions[base_url] = session
+        return session
+
+def hmac_sha256(api_secret, payload):
+    return hmac.new(api_secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+def sign_params(exchange_id, api_key, api_secret, params):
+    timestamp = int(time.time() * 1000)
+    if exchange_id == 'binance':
+        params = dict(params)
+        params['timestamp'] = timestamp
+        params['signature'] = hmac_sha256(api_secret, urlencode(params))
+        headers = {'X-MBX-APIKEY': api_key}
+    elif exchange_id == 'bybit':
+        # v5 header auth signs timestamp + key + receive window + the query string exactly as it is sent
+        params = urlencode(params)
+        headers = {
+            'X-BAPI-API-KEY': api_key,
+            'X-BAPI-TIMESTAMP': str(timestamp),
+            'X-BAPI-RECV-WINDOW': str(BYBIT_RECV_WINDOW_MS),
+            'X-BAPI-SIGN': hmac_sha256(api_secret, f'{timestamp}{api_key}{BYBIT_RECV_WINDOW_MS}{params}'),
+        }
+    else:
+        raise ValueError(f'Unsupported exchange: {exchange_id}')
+    return params, headers
+
+def backoff_delay(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    # Full jitter so parallel workers don't retry in lockstep
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+def should_retry(exchange_id, response):
+    if response.status_code in RETRY_STATUS_CODES:
+        return True
+    if exchange_id == 'bybit' and response.status_code == 200:
+        try:
+            return response.json().get('retCode') in RETRY_BYBIT_RET_CODES
+        except ValueError:
+            return False
+    return False
+
+def send_request(exchange_id, method, endpoint, params=None, api_key=None, api_secret=None, headers=None):
+    import requests
+
+    base_url = BASE_URLS[exchange_id]
+    session = get_session(base_url)
+
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire(exchange_id, endpoint, api_key)
+
+        # Sign on every attempt, after any rate limit wait, so the timestamp stays inside the receive window
+        if api_secret:
+            request_params, request_headers = sign_params(exchange_id, api_key, api_secret, params or {})
+        else:
+            request_params, request_headers = params, {}
+        request_headers.update(headers or {})
+
+        try:
+            with timed('exchange', exchange_id, endpoint, rate_limiter.endpoint_weight(exchange_id, endpoint)) as outcome:
+                response = session.request(method, base_url + endpoint, params=request_params, headers=request_headers, timeout=REQUEST_TIMEOUT)
+                outcome['error'] = response.status_code >= 400
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+
+        rate_limiter.record_response(exchange_id, endpoint, response.headers, response.status_code, api_key)
+        if attempt < MAX_RETRIES and should_retry(exchange_id, response):
+            time.sleep(backoff_delay(attempt, response.headers.get('Retry-After')))
+            continue
+        return response.json()
+
+def signed_get(exchange_id, endpoint, api_key, api_secret, params=None):
+    return send_request(exchange_id, 'GET', endpoint, params, api_key, api_secret)
+
+def public_get(exchange_id, endpoint, params=None):
+    return send_request(exchange_id, 'GET', endpoint, params)
@@ -1,26 +1,17 @@
-import yaml
 import argparse
 import sys
+from config_loader import read_yaml
 
 # Constants for file paths
 CONFIG_YAML = '/home/stablesail/passivbot/manager/config.yaml'
 
-def read_yaml(file_path):
-    try:
-        with open(file_path, 'r') as file:
-            return yaml.safe_load(file)
-    except FileNotFoundError:
-        print(f"Error: File '{file_path}' not found.", file=sys.stderr)
-        sys.exit(1)
-    except yaml.YAMLError as e:
-        print(f"Error parsing YAML file '{file_path}': {e}", file=sys.stderr)
-        sys.exit(2)
-
 def find_user_entries(account_name, config_data):
     return [user for user in config_data.get('instances', []) if user and user.get('user') == account_name]
 
-def list_coins(account_name):
-    config_data = read_yaml(CONFIG_YAML)
+def list_coins(account_name, config_data=None):
+    # config_data can be passed in by callers that already hold config.yaml, like config_service.py
+    if config_data is None:
+        config_data = read_yaml(CONFIG_YAML)
     user_entries = find_user_entries(account_name, config_data)
 
     if not user_entries:
@@ -0,0 +1,83 @@
+import json
+import os
+import sys
+import threading
+import time
+
+from rate_limiter import call_ccxt
+
+# Market definitions change rarely; refetch them at most this often
+CACHE_FOLDER = '/home/stablesail/botcode/cache'
+MARKETS_TTL_SECONDS = 6 * 60 * 60
+
+# Attributes ccxt fills in set_markets(), shared by reference between instances of one exchange
+MARKET_ATTRIBUTES = (
+    'markets',
+    'markets_by_id',
+    'symbols',
+    'ids',
+    'currencies',
+    'currencies_by_id',
+    'codes',
+    'baseCurrencies',
+    'quoteCurrencies',
+)
+
+_shared_markets = {}
+_exchange_locks = {}
+_locks_lock = threading.Lock()
+
+def exchange_lock(exchange_id):
+    with _locks_lock:
+        return _exchange_locks.setdefault(exchange_id, threading.Lock())
+
+def cache_path(name):
+    return os.path.join(CACHE_FOLDER, f'{name}.json')
+
+def read_cache(name, ttl):
+    try:
+        with open(cache_path(name), 'r') as file:
+            cached = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if cached.get('fetched_at', 0) + ttl <= time.time():
+        return None
+    return cached
+
+def write_cache(name, data):
+    # Write to a temp file and rename so other processes never read a partial cache
+    path = cache_path(name)
+    try:
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(data, file, default=str)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f'Failed to write cache file {path}: {e}', file=sys.stderr)
+
+def load_markets(exchange, ttl=MARKETS_TTL_SECONDS):
+    # One fetch per exchange per TTL, shared in-process and across runs through the disk cache
+    with exchange_lock(exchange.id):
+        shared = _shared_markets.get(exchange.id)
+        if shared is None or shared['fetched_at'] + ttl <= time.time():
+            name = f'{exchange.id}_markets'
+            cached = read_cache(name, ttl)
+            if cached is not None:
+                exchange.set_markets(cached['markets'], cached['currencies'])
+                fetched_at = cached['fetched_at']
+            else:
+                call_ccxt(exchange, 'load_markets', True)
+                fetched_at = time.time()
+                write_cache(name, {
+                    'fetched_at': fetched_at,
+                    'markets': exchange.markets,
+                    'currencies': exchange.currencies,
+                })
+            shared = {'fetched_at': fetched_at}
+            shared.update((attribute, getattr(exchange, attribute)) for attribute in MARKET_ATTRIBUTES)
+            _shared_markets[exchange.id] = shared
+
+    for attribute in MARKET_ATTRIBUTES:
+        setattr(exchange, attribute, shared[attribute])
+    return exchange.markets
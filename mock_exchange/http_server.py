@@ -0,0 +1,233 @@
+import argparse
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for the Binance and Bybit REST endpoints used by stablesail_db.py
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'rest')
+
+ROUTES = {
+    # Binance futures
+    '/fapi/v1/exchangeInfo': 'binance_fapi_exchange_info.json',
+    '/fapi/v1/income': 'binance_income.json',
+    '/fapi/v1/leverageBracket': 'binance_leverage_bracket.json',
+    '/fapi/v3/account': 'binance_account.json',
+    '/fapi/v3/positionRisk': 'binance_position_risk.json',
+    # Binance spot, margin and coin-m, fetched by ccxt when loading markets
+    '/api/v3/exchangeInfo': 'binance_spot_exchange_info.json',
+    '/dapi/v1/exchangeInfo': 'binance_dapi_exchange_info.json',
+    '/sapi/v1/capital/config/getall': 'binance_capital_config.json',
+    '/sapi/v1/margin/allPairs': 'binance_margin_pairs.json',
+    '/sapi/v1/margin/isolated/allPairs': 'binance_margin_pairs.json',
+    # Bybit
+    '/v5/asset/coin/query-info': 'bybit_coin_info.json',
+    '/v5/user/query-api': 'bybit_query_api.json',
+    '/v5/account/info': 'bybit_account_info.json',
+    '/v5/account/wallet-balance': 'bybit_wallet_balance.json',
+    '/v5/position/list': 'bybit_position_list.json',
+    '/v5/position/closed-pnl': 'bybit_closed_pnl.json',
+}
+
+# Only linear instruments are recorded; other categories answer with an empty list
+BYBIT_INSTRUMENTS = {
+    'linear': 'bybit_instruments_linear.json',
+}
+BYBIT_INSTRUMENTS_EMPTY = 'bybit_instruments_empty.json'
+
+# Closed PnL history is generated from the recorded records, ending just before the server started,
+# dense enough that a 7-day Bybit window and the 30-day Binance period both take several pages
+HISTORY_DAYS = 35
+RECORDS_PER_DAY = 40
+LATEST_RECORD_AGE_MS = 5 * 60 * 1000
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Largest page each endpoint returns, whatever limit is asked for
+BYBIT_CLOSED_PNL_MAX_LIMIT = 100
+BINANCE_INCOME_MAX_LIMIT = 1000
+
+def build_history(templates, now_ms, set_record):
+    # Cycles through the recorded records at even spacing; returns (times, records) sorted by time
+    spacing = DAY_MS // RECORDS_PER_DAY
+    count = HISTORY_DAYS * RECORDS_PER_DAY
+    first_ms = now_ms - LATEST_RECORD_AGE_MS - (count - 1) * spacing
+    records = [set_record(dict(templates[index % len(templates)]), index, first_ms + index * spacing) for index in range(count)]
+    return [first_ms + index * spacing for index in range(count)], records
+
+def set_bybit_record(record, index, ts):
+    record['orderId'] = f"{record['orderId'][:-12]}{index:012d}"
+    record['createdTime'] = str(ts)
+    record['updatedTime'] = str(ts + 150)
+    return record
+
+def set_binance_record(record, index, ts):
+    record['tranId'] = 9689322392 + index
+    record['tradeId'] = str(2059192 + index)
+    record['time'] = ts
+    return record
+
+def query_int(query, name, default):
+    try:
+        return int(query[name][0])
+    except (KeyError, IndexError, ValueError):
+        return default
+
+class RequestStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.bytes_received = 0
+            self.bytes_sent = 0
+            self.by_endpoint = {}
+            self.unknown = {}
+
+    def record(self, endpoint, bytes_received, bytes_sent, known):
+        with self.lock:
+            self.requests += 1
+            self.bytes_received += bytes_received
+            self.bytes_sent += bytes_sent
+            self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + 1
+            if not known:
+                self.unknown[endpoint] = self.unknown.get(endpoint, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'bytes_received': self.bytes_received,
+                'bytes_sent': self.bytes_sent,
+                'by_endpoint': dict(self.by_endpoint),
+                'unknown': dict(self.unknown),
+            }
+
+class MockExchangeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, MockExchangeHandler)
+        self.stats = RequestStats()
+        self.fixtures = {}
+        for filename in set(ROUTES.values()) | set(BYBIT_INSTRUMENTS.values()) | {BYBIT_INSTRUMENTS_EMPTY}:
+            with open(os.path.join(FIXTURES_FOLDER, filename), 'rb') as file:
+                self.fixtures[filename] = file.read()
+
+        now_ms = int(time.time() * 1000)
+        self.bybit_pnl_history = build_history(json.loads(self.fixtures[ROUTES['/v5/position/closed-pnl']])['result']['list'], now_ms, set_bybit_record)
+        self.binance_income_history = build_history(json.loads(self.fixtures[ROUTES['/fapi/v1/income']]), now_ms, set_binance_record)
+
+    def records_between(self, history, start_time, end_time):
+        times, records = history
+        return records[bisect.bisect_left(times, start_time):bisect.bisect_right(times, end_time)]
+
+    def bybit_closed_pnl(self, query):
+        # Newest first within startTime..endTime; the cursor is the offset of the next page
+        now_ms = int(time.time() * 1000)
+        end_time = query_int(query, 'endTime', now_ms)
+        start_time = query_int(query, 'startTime', end_time - 7 * DAY_MS)
+        limit = min(query_int(query, 'limit', 50), BYBIT_CLOSED_PNL_MAX_LIMIT)
+        offset = query_int(query, 'cursor', 0)
+        records = self.records_between(self.bybit_pnl_history, start_time, end_time)[::-1]
+        next_offset = offset + limit
+        return json.dumps({
+            'retCode': 0,
+            'retMsg': 'OK',
+            'result': {'category': 'linear', 'list': records[offset:next_offset],
+                       'nextPageCursor': str(next_offset) if next_offset < len(records) else ''},
+            'retExtInfo': {},
+            'time': now_ms,
+        }).encode()
+
+    def binance_income(self, query):
+        # Oldest first within startTime..endTime, at most limit records
+        end_time = query_int(query, 'endTime', int(time.time() * 1000))
+        start_time = query_int(query, 'startTime', end_time - 7 * DAY_MS)
+        limit = min(query_int(query, 'limit', 100), BINANCE_INCOME_MAX_LIMIT)
+        return json.dumps(self.records_between(self.binance_income_history, start_time, end_time)[:limit]).encode()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+class MockExchangeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def fixture_for(self, path, query):
+        if path == '/v5/market/instruments-info':
+            category = query.get('category', [''])[0]
+            return BYBIT_INSTRUMENTS.get(category, BYBIT_INSTRUMENTS_EMPTY)
+        return ROUTES.get(path)
+
+    def respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        # Harness endpoint: GET /__stats returns the counters, ?reset=1 clears them
+        if url.path == '/__stats':
+            body = json.dumps(self.server.stats.snapshot()).encode()
+            if 'reset' in query:
+                self.server.stats.reset()
+            self.respond(200, body)
+            return
+
+        fixture = self.fixture_for(url.path, query)
+        if url.path == '/v5/position/closed-pnl':
+            body = self.server.bybit_closed_pnl(query)
+        elif url.path == '/fapi/v1/income':
+            body = self.server.binance_income(query)
+        elif fixture is not None:
+            body = self.server.fixtures[fixture]
+        elif url.path.startswith('/v5/'):
+            body = json.dumps({'retCode': 0, 'retMsg': 'OK', 'result': {'list': []}, 'retExtInfo': {}, 'time': 0}).encode()
+        else:
+            body = b'{}'
+        self.respond(200, body)
+
+        bytes_received = len(self.requestline) + len(str(self.headers)) + length
+        self.server.stats.record(url.path, bytes_received, len(body), fixture is not None)
+
+    do_GET = handle_request
+    do_POST = handle_request
+    do_PUT = handle_request
+    do_DELETE = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(host='127.0.0.1', port=0):
+    server = MockExchangeServer((host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve recorded Binance and Bybit REST responses locally.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8780, help='Port to listen on')
+    args = parser.parse_args()
+
+    server = MockExchangeServer((args.host, args.port))
+    print(f'Serving mock exchange on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import websockets
+
+# Local stand-in for the Binance user-data and Bybit private streams, used to run stablesail_stream.py offline
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'stream')
+BINANCE_FIXTURE = 'binance_user_data.jsonl'
+BYBIT_FIXTURE = 'bybit_private.jsonl'
+LISTEN_KEY = 'replay-listen-key'
+
+def load_messages(filename):
+    with open(os.path.join(FIXTURES_FOLDER, filename), 'r') as file:
+        return [line.strip() for line in file if line.strip()]
+
+class ListenKeyHandler(BaseHTTPRequestHandler):
+    # Answers POST/PUT/DELETE /fapi/v1/listenKey like Binance does
+    def respond(self):
+        if self.path.split('?')[0] != '/fapi/v1/listenKey':
+            self.send_error(404)
+            return
+        body = json.dumps({'listenKey': LISTEN_KEY}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = respond
+    do_PUT = respond
+    do_DELETE = respond
+
+    def log_message(self, format, *args):
+        pass
+
+async def replay(websocket, messages, interval):
+    for message in messages:
+        await websocket.send(message)
+        await asyncio.sleep(interval)
+
+async def handle_bybit(websocket, messages, interval):
+    # Acknowledge auth and subscribe before replaying, as the real stream does
+    async for request in websocket:
+        request = json.loads(request)
+        if request.get('op') == 'auth':
+            await websocket.send(json.dumps({'op': 'auth', 'success': True, 'ret_msg': '', 'conn_id': 'replay'}))
+        elif request.get('op') == 'subscribe':
+            await websocket.send(json.dumps({'op': 'subscribe', 'success': True, 'ret_msg': '', 'conn_id': 'replay'}))
+            await replay(websocket, messages, interval)
+        elif request.get('op') == 'ping':
+            await websocket.send(json.dumps({'op': 'pong', 'success': True, 'ret_msg': 'pong', 'conn_id': 'replay'}))
+
+async def serve(host, port, interval, close_after_replay):
+    binance_messages = load_messages(BINANCE_FIXTURE)
+    bybit_messages = load_messages(BYBIT_FIXTURE)
+
+    async def handler(websocket):
+        path = websocket.request.path
+        if path.startswith('/ws/'):
+            await replay(websocket, binance_messages, interval)
+            if not close_after_replay:
+                await websocket.wait_closed()
+        elif path.startswith('/v5/private'):
+            await handle_bybit(websocket, bybit_messages, interval)
+        else:
+            await websocket.close(code=1008, reason='unknown stream')
+
+    async with websockets.serve(handler, host, port):
+        print(f'Replaying streams on ws://{host}:{port} (Binance /ws/<listenKey>, Bybit /v5/private)')
+        await asyncio.Future()
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded exchange user-data stream messages over a local websocket.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Websocket port')
+    parser.add_argument('--http_port', type=int, default=8766, help='Port for the Binance listenKey REST stand-in')
+    parser.add_argument('--interval', type=float, default=0.1, help='Seconds between replayed messages')
+    parser.add_argument('--close_after_replay', action='store_true', help='Close Binance connections once all messages are sent')
+    args = parser.parse_args()
+
+    http_server = ThreadingHTTPServer((args.host, args.http_port), ListenKeyHandler)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    print(f'Serving listen keys on http://{args.host}:{args.http_port}')
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.interval, args.close_after_replay))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import argparse
+import math
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+maindb_file = '/home/stablesail/botcode/website_data.db'
+
+# Days of history the analytics cover
+DEFAULT_DAYS = 365
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Daily returns are annualized with this many periods per year; crypto trades every day
+PERIODS_PER_YEAR = 365
+
+def init_tables(db_conn):
+    # Per-day history, kept up to date incrementally from the rows added since the last pass
+    db_conn.execute('''CREATE TABLE IF NOT EXISTS account_daily_pnl (
+                           account_name TEXT NOT NULL,
+                           day TEXT NOT NULL,
+                           pnl REAL NOT NULL DEFAULT 0,
+                           trades INTEGER NOT NULL DEFAULT 0,
+                           balance REAL,
+                           balance_ts INTEGER,
+                           PRIMARY KEY (account_name, day)
+                       ) WITHOUT ROWID''')
+    db_conn.execute('''CREATE TABLE IF NOT EXISTS account_coin_daily_pnl (
+                           account_name TEXT NOT NULL,
+                           symbol TEXT NOT NULL,
+                           day TEXT NOT NULL,
+                           pnl REAL NOT NULL,
+                           trades INTEGER NOT NULL,
+                           PRIMARY KEY (account_name, symbol, day)
+                       ) WITHOUT ROWID''')
+    db_conn.execute('''CREATE TABLE IF NOT EXISTS analytics_state (
+                           source TEXT PRIMARY KEY,
+                           last_rowid INTEGER NOT NULL
+                       )''')
+    # Summary tables, replaced on every pass
+    db_conn.execute('''CREATE TABLE IF NOT EXISTS account_analytics (
+                           account_name TEXT PRIMARY KEY,
+                           window_days INTEGER NOT NULL,
+                           total_pnl REAL NOT NULL,
+                           pnl_7d REAL NOT NULL,
+                           pnl_30d REAL NOT NULL,
+                           best_day REAL NOT NULL,
+                           worst_day REAL NOT NULL,
+                           winning_days INTEGER NOT NULL,
+                           trading_days INTEGER NOT NULL,
+                           max_drawdown REAL,
+                           volatility REAL,
+                           sharpe REAL,
+                           updated_at INTEGER NOT NULL
+                       )''')
+    db_conn.execute('''CREATE TABLE IF NOT EXISTS account_coin_pnl (
+                           account_name TEXT NOT NULL,
+                           symbol TEXT NOT NULL,
+                           pnl REAL NOT NULL,
+                           trades INTEGER NOT NULL,
+                           share REAL,
+                           PRIMARY KEY (account_name, symbol)
+                       )''')
+
+def new_rows(db_conn, source):
+    # Rowid range added to a source table since the last pass
+    row = db_conn.execute('SELECT last_rowid FROM analytics_state WHERE source = ?', (source,)).fetchone()
+    last_rowid = row[0] if row else 0
+    max_rowid = db_conn.execute(f'SELECT IFNULL(MAX(rowid), 0) FROM {source}').fetchone()[0]
+    return last_rowid, max_rowid
+
+def update_daily_history(db_conn):
+    # pnl_ledger rows are only ever inserted once (INSERT OR IGNORE), so adding the new rows' sums is exact
+    ledger_from, ledger_to = new_rows(db_conn, 'pnl_ledger')
+    snapshots_from, snapshots_to = new_rows(db_conn, 'account_snapshots')
+    db_conn.execute('''INSERT INTO account_daily_pnl (account_name, day, pnl, trades)
+                       SELECT account_name, date(ts / 1000, 'unixepoch'), SUM(pnl), COUNT(*) FROM pnl_ledger
+                       WHERE rowid > ? AND rowid <= ?
+                       GROUP BY 1, 2
+                       ON CONFLICT(account_name, day) DO UPDATE SET pnl = pnl + excluded.pnl, trades = trades + excluded.trades''',
+                    (ledger_from, ledger_to))
+    db_conn.execute('''INSERT INTO account_coin_daily_pnl (account_name, symbol, day, pnl, trades)
+                       SELECT account_name, symbol, date(ts / 1000, 'unixepoch'), SUM(pnl), COUNT(*) FROM pnl_ledger
+                       WHERE rowid > ? AND rowid <= ?
+                       GROUP BY 1, 2, 3
+                       ON CONFLICT(account_name, symbol, day) DO UPDATE SET pnl = pnl + excluded.pnl, trades = trades + excluded.trades''',
+                    (ledger_from, ledger_to))
+    # The balance of a day is the one from its latest snapshot
+    db_conn.execute('''INSERT INTO account_daily_pnl (account_name, day, balance, balance_ts)
+                       SELECT account_name, date(ts / 1000, 'unixepoch'), total_balance, MAX(ts) FROM account_snapshots
+                       WHERE rowid > ? AND rowid <= ? AND total_balance IS NOT NULL
+                       GROUP BY 1, 2
+                       ON CONFLICT(account_name, day) DO UPDATE SET balance = excluded.balance, balance_ts = excluded.balance_ts
+                       WHERE excluded.balance_ts >= IFNULL(balance_ts, 0)''',
+                    (snapshots_from, snapshots_to))
+    db_conn.executemany('''INSERT INTO analytics_state (source, last_rowid) VALUES (?, ?)
+                           ON CONFLICT(source) DO UPDATE SET last_rowid = excluded.last_rowid''',
+                        [('pnl_ledger', ledger_to), ('account_snapshots', snapshots_to)])
+
+def load_history(db_conn, first_day, days):
+    first_label, last_label = (np.datetime64(first_day, 'D') + np.array([0, days - 1])).astype(str).tolist()
+    daily_rows = db_conn.execute('''SELECT account_name, day, pnl, balance FROM account_daily_pnl
+                                    WHERE day >= ? AND day <= ?''', (first_label, last_label)).fetchall()
+    coin_rows = db_conn.execute('''SELECT account_name, symbol, SUM(pnl), SUM(trades) FROM account_coin_daily_pnl
+                                   WHERE day >= ? AND day <= ?
+                                   GROUP BY account_name, symbol''', (first_label, last_label)).fetchall()
+    daily = np.array(daily_rows, dtype=[('account', 'O'), ('day', 'O'), ('pnl', 'f8'), ('balance', 'f8')])
+    coins = np.array(coin_rows, dtype=[('account', 'O'), ('symbol', 'O'), ('pnl', 'f8'), ('trades', 'i8')])
+    return daily, coins
+
+def forward_fill(values):
+    # Each NaN takes the last value before it in its row; leading NaNs stay NaN
+    filled_index = np.where(np.isnan(values), 0, np.arange(values.shape[1]))
+    np.maximum.accumulate(filled_index, axis=1, out=filled_index)
+    return values[np.arange(values.shape[0])[:, None], filled_index]
+
+def compute_analytics(daily, coins, first_day, days):
+    # Every account with a ledger row in the window also has a daily row, so the daily rows name all accounts
+    accounts, account_index = np.unique(daily['account'].astype(str), return_inverse=True)
+    day_index = daily['day'].astype('datetime64[D]').astype(np.int64) - first_day
+
+    # accounts x days matrices: realized PnL per day, balance at the last snapshot of each day carried forward
+    daily_pnl = np.zeros((len(accounts), days))
+    daily_pnl[account_index, day_index] = daily['pnl']
+    balances = np.full((len(accounts), days), np.nan)
+    balances[account_index, day_index] = daily['balance']
+    balances = forward_fill(balances)
+
+    total_pnl = daily_pnl.sum(axis=1)
+    pnl_7d = daily_pnl[:, -7:].sum(axis=1)
+    pnl_30d = daily_pnl[:, -30:].sum(axis=1)
+    winning_days = (daily_pnl > 0).sum(axis=1)
+    trading_days = (daily_pnl != 0).sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Drawdown of the balance from its running peak
+        peaks = np.fmax.accumulate(balances, axis=1)
+        drawdowns = np.where(peaks > 0, 1 - balances / peaks, np.nan)
+        has_balance = ~np.all(np.isnan(drawdowns), axis=1)
+        max_drawdown = np.full(len(accounts), np.nan)
+        max_drawdown[has_balance] = np.nanmax(drawdowns[has_balance], axis=1)
+
+        # Daily returns are the day's realized PnL over the balance it started with
+        start_balances = np.concatenate([np.full((len(accounts), 1), np.nan), balances[:, :-1]], axis=1)
+        returns = np.where(start_balances > 0, daily_pnl / start_balances, np.nan)
+        enough_days = (~np.isnan(returns)).sum(axis=1) >= 2
+        mean_returns = np.full(len(accounts), np.nan)
+        std_returns = np.full(len(accounts), np.nan)
+        mean_returns[enough_days] = np.nanmean(returns[enough_days], axis=1)
+        std_returns[enough_days] = np.nanstd(returns[enough_days], axis=1, ddof=1)
+        volatility = std_returns * np.sqrt(PERIODS_PER_YEAR)
+        sharpe = np.where(std_returns > 0, mean_returns / std_returns * np.sqrt(PERIODS_PER_YEAR), np.nan)
+
+        # Each coin's share of the account's PnL over the window
+        coin_totals = total_pnl[np.searchsorted(accounts, coins['account'].astype(str))]
+        coin_share = np.where(coin_totals != 0, coins['pnl'] / coin_totals, np.nan)
+
+    return {
+        'accounts': accounts,
+        'total_pnl': total_pnl,
+        'pnl_7d': pnl_7d,
+        'pnl_30d': pnl_30d,
+        'best_day': daily_pnl.max(axis=1),
+        'worst_day': daily_pnl.min(axis=1),
+        'winning_days': winning_days,
+        'trading_days': trading_days,
+        'max_drawdown': max_drawdown,
+        'volatility': volatility,
+        'sharpe': sharpe,
+        'coin_share': coin_share,
+    }
+
+def nullable(values):
+    # NaN becomes NULL in the summary tables
+    return [None if math.isnan(value) else value for value in values.tolist()]
+
+def write_analytics(db_conn, results, coins, days, now_ms):
+    accounts = results['accounts'].tolist()
+    analytics_rows = zip(accounts, [days] * len(accounts),
+                         results['total_pnl'].tolist(), results['pnl_7d'].tolist(), results['pnl_30d'].tolist(),
+                         results['best_day'].tolist(), results['worst_day'].tolist(),
+                         results['winning_days'].tolist(), results['trading_days'].tolist(),
+                         nullable(results['max_drawdown']), nullable(results['volatility']), nullable(results['sharpe']),
+                         [now_ms] * len(accounts))
+    coin_rows = zip(coins['account'].tolist(), coins['symbol'].tolist(), coins['pnl'].tolist(),
+                    coins['trades'].tolist(), nullable(results['coin_share']))
+
+    db_conn.execute('DELETE FROM account_analytics')
+    db_conn.execute('DELETE FROM account_coin_pnl')
+    db_conn.executemany('INSERT INTO account_analytics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', analytics_rows)
+    db_conn.executemany('INSERT INTO account_coin_pnl VALUES (?, ?, ?, ?, ?)', coin_rows)
+
+def run_analytics(db_conn, days=DEFAULT_DAYS, now_ms=None):
+    # stablesail_db.py calls this after a refresh pass with its own connection, under its db_lock
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    first_day = now_ms // DAY_MS - days + 1
+    # One transaction, so the website reads either the previous pass or this one
+    with db_conn:
+        init_tables(db_conn)
+        update_daily_history(db_conn)
+        daily, coins = load_history(db_conn, first_day, days)
+        results = compute_analytics(daily, coins, first_day, days)
+        write_analytics(db_conn, results, coins, days, now_ms)
+    return len(results['accounts'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute drawdown, daily PnL, Sharpe-like ratios and per-coin PnL for every account.')
+    parser.add_argument('--db', type=str, default=maindb_file, help='SQLite database written by stablesail_db.py')
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help='Days of history to cover')
+    args = parser.parse_args()
+    if args.days < 1:
+        parser.error('--days must be at least 1')
+
+    try:
+        db_conn = sqlite3.connect(args.db)
+        started = time.perf_counter()
+        count = run_analytics(db_conn, args.days)
+        db_conn.close()
+    except sqlite3.Error as e:
+        print(f'Failed to compute analytics: {e}')
+        sys.exit(1)
+    print(f'Analytics updated for {count} accounts in {time.perf_counter() - started:.2f} s.')
+
+if __name__ == '__main__':
+    main()
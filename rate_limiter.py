@@ -0,0 +1,116 @@
+import threading
+import time
+
+from refresh_metrics import timed
+
+# Per-IP limits as (capacity, period in seconds)
+# Binance futures: 2400 request weight per minute. Bybit: 600 requests per 5 seconds.
+IP_LIMITS = {
+    'binance': (2400, 60),
+    'bybit': (600, 5),
+}
+
+# Bybit also limits each endpoint per account; corrected from the X-Bapi-Limit header once seen
+DEFAULT_BYBIT_ENDPOINT_LIMIT = (10, 1)
+
+# Known request weight of each endpoint or ccxt method, anything missing costs 1
+ENDPOINT_WEIGHTS = {
+    ('binance', '/fapi/v1/income'): 30,
+    ('binance', 'load_markets'): 40,
+    ('binance', 'fetch_balance'): 5,
+    ('binance', 'fetch_positions'): 5,
+}
+
+# Pause used after a 418/429 that came without a Retry-After header
+DEFAULT_PENALTY_SECONDS = 5
+
+class TokenBucket:
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, weight=1):
+        # Wait until the bucket holds enough tokens instead of letting the exchange reject the call
+        weight = min(weight, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = max(self.blocked_until - now, (weight - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def sync(self, remaining, capacity=None, period=None):
+        # Trust the server's view of the window when it is lower than ours
+        with self.lock:
+            if capacity:
+                self.capacity = capacity
+                self.rate = capacity / (period or 1)
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, remaining)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.tokens = 0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.updated = time.monotonic()
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def get_bucket(key, limit):
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(*limit)
+            _buckets[key] = bucket
+        return bucket
+
+def ip_bucket(exchange_id):
+    return get_bucket((exchange_id, 'ip'), IP_LIMITS[exchange_id])
+
+def endpoint_bucket(exchange_id, endpoint, account_key):
+    return get_bucket((exchange_id, endpoint, account_key), DEFAULT_BYBIT_ENDPOINT_LIMIT)
+
+def endpoint_weight(exchange_id, endpoint):
+    return ENDPOINT_WEIGHTS.get((exchange_id, endpoint), 1)
+
+def acquire(exchange_id, endpoint, account_key=None):
+    ip_bucket(exchange_id).acquire(endpoint_weight(exchange_id, endpoint))
+    if exchange_id == 'bybit' and account_key:
+        endpoint_bucket(exchange_id, endpoint, account_key).acquire()
+
+def record_response(exchange_id, endpoint, headers, status_code=None, account_key=None):
+    headers = {key.lower(): value for key, value in (headers or {}).items()}
+
+    if exchange_id == 'binance' and 'x-mbx-used-weight-1m' in headers:
+        capacity = IP_LIMITS['binance'][0]
+        ip_bucket('binance').sync(capacity - int(headers['x-mbx-used-weight-1m']))
+    elif exchange_id == 'bybit' and account_key and 'x-bapi-limit-status' in headers:
+        limit = int(headers['x-bapi-limit']) if 'x-bapi-limit' in headers else None
+        endpoint_bucket(exchange_id, endpoint, account_key).sync(int(headers['x-bapi-limit-status']), limit)
+
+    if status_code in (418, 429):
+        try:
+            penalty = float(headers.get('retry-after', DEFAULT_PENALTY_SECONDS))
+        except ValueError:
+            penalty = DEFAULT_PENALTY_SECONDS
+        ip_bucket(exchange_id).pause(penalty)
+
+def call_ccxt(exchange, method, *args, **kwargs):
+    acquire(exchange.id, method, exchange.apiKey)
+    try:
+        with timed('exchange', exchange.id, method, endpoint_weight(exchange.id, method)):
+            return getattr(exchange, method)(*args, **kwargs)
+    finally:
+        record_response(exchange.id, method, exchange.last_response_headers, account_key=exchange.apiKey)
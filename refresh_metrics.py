@@ -0,0 +1,205 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Per-call profiles collected when a run is profiled; None when profiling is off
+_profiles = None
+_profiles_lock = threading.Lock()
+
+# The account a refresh worker is currently processing, used to tag its calls
+_context = threading.local()
+
+def set_account(account_name):
+    _context.account = account_name
+
+def current_account():
+    return getattr(_context, 'account', None)
+
+class Histogram:
+    def __init__(self):
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[index] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+class RunMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.calls = {}
+        self.accounts = {}
+
+    def observe(self, kind, exchange, endpoint, seconds, weight=0, error=False, account=None):
+        with self.lock:
+            call = self.calls.get((kind, exchange, endpoint))
+            if call is None:
+                call = {'latency': Histogram(), 'errors': 0, 'weight': 0}
+                self.calls[(kind, exchange, endpoint)] = call
+            call['latency'].observe(seconds)
+            call['errors'] += int(error)
+            call['weight'] += weight
+
+            if account:
+                totals = self.accounts.setdefault(account, {'calls': 0, 'errors': 0, 'weight': 0, 'seconds': 0.0})
+                totals['calls'] += 1
+                totals['errors'] += int(error)
+                totals['weight'] += weight
+                totals['seconds'] += seconds
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            calls = sorted(self.calls.items())
+            accounts = sorted(self.accounts.items())
+
+        metric_names = {
+            'exchange': ('stablesail_request_duration_seconds', 'Latency of exchange calls'),
+            'db': ('stablesail_db_write_duration_seconds', 'Latency of database writes'),
+        }
+        for kind, (name, description) in metric_names.items():
+            lines.append(f'# HELP {name} {description}.')
+            lines.append(f'# TYPE {name} histogram')
+            for (call_kind, exchange, endpoint), call in calls:
+                if call_kind != kind:
+                    continue
+                labels = f'exchange="{exchange}",endpoint="{endpoint}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, call['latency'].bucket_counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {call["latency"].count}')
+                lines.append(f'{name}_sum{{{labels}}} {call["latency"].sum:.6f}')
+                lines.append(f'{name}_count{{{labels}}} {call["latency"].count}')
+
+        lines.append('# HELP stablesail_errors_total Failed exchange calls and database writes.')
+        lines.append('# TYPE stablesail_errors_total counter')
+        for (kind, exchange, endpoint), call in calls:
+            lines.append(f'stablesail_errors_total{{kind="{kind}",exchange="{exchange}",endpoint="{endpoint}"}} {call["errors"]}')
+
+        lines.append('# HELP stablesail_request_weight_total Request weight charged per endpoint.')
+        lines.append('# TYPE stablesail_request_weight_total counter')
+        for (kind, exchange, endpoint), call in calls:
+            if kind == 'exchange':
+                lines.append(f'stablesail_request_weight_total{{exchange="{exchange}",endpoint="{endpoint}"}} {call["weight"]}')
+
+        account_metrics = (
+            ('calls', 'stablesail_account_calls_total', 'Exchange calls and database writes per account.'),
+            ('errors', 'stablesail_account_errors_total', 'Failed calls per account.'),
+            ('weight', 'stablesail_account_request_weight_total', 'Request weight charged per account.'),
+            ('seconds', 'stablesail_account_call_seconds_total', 'Time spent in calls per account.'),
+        )
+        for field, name, description in account_metrics:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} counter')
+            for account, totals in accounts:
+                lines.append(f'{name}{{account="{account}"}} {totals[field]}')
+
+        lines.append('# HELP stablesail_run_duration_seconds Duration of the refresh run.')
+        lines.append('# TYPE stablesail_run_duration_seconds gauge')
+        lines.append(f'stablesail_run_duration_seconds {time.time() - self.started_at:.3f}')
+        lines.append('# HELP stablesail_run_timestamp_seconds Time the metrics were written.')
+        lines.append('# TYPE stablesail_run_timestamp_seconds gauge')
+        lines.append(f'stablesail_run_timestamp_seconds {time.time():.0f}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, extra=None):
+        with self.lock:
+            calls = [{
+                'kind': kind,
+                'exchange': exchange,
+                'endpoint': endpoint,
+                'count': call['latency'].count,
+                'errors': call['errors'],
+                'weight': call['weight'],
+                'total_seconds': round(call['latency'].sum, 6),
+                'mean_seconds': round(call['latency'].sum / call['latency'].count, 6) if call['latency'].count else 0,
+                'max_seconds': round(call['latency'].max, 6),
+            } for (kind, exchange, endpoint), call in sorted(self.calls.items())]
+            accounts = {account: dict(totals, seconds=round(totals['seconds'], 6)) for account, totals in sorted(self.accounts.items())}
+        summary = {
+            'started_at': datetime_string(self.started_at),
+            'duration_seconds': round(time.time() - self.started_at, 3),
+            'calls': sorted(calls, key=lambda call: call['total_seconds'], reverse=True),
+            'accounts': accounts,
+        }
+        summary.update(extra or {})
+        return summary
+
+metrics = RunMetrics()
+
+def datetime_string(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+@contextmanager
+def timed(kind, exchange, endpoint, weight=0):
+    # Callers can flag a call that returned normally but failed, e.g. on an HTTP error status
+    outcome = {'error': False}
+    started = time.perf_counter()
+    try:
+        yield outcome
+    except BaseException:
+        outcome['error'] = True
+        raise
+    finally:
+        metrics.observe(kind, exchange, endpoint, time.perf_counter() - started, weight, outcome['error'], current_account())
+
+def write_file_atomically(path, content):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as file:
+        file.write(content)
+    os.replace(temp_path, path)
+
+def write_prometheus(path):
+    try:
+        write_file_atomically(path, metrics.prometheus_text())
+    except OSError as e:
+        print(f'Failed to write metrics file {path}: {e}')
+
+def write_summary(path, extra=None):
+    try:
+        write_file_atomically(path, json.dumps(metrics.summary(extra), indent=4))
+    except OSError as e:
+        print(f'Failed to write run summary {path}: {e}')
+
+def enable_profiling():
+    global _profiles
+    _profiles = []
+
+def profiled(func, *args, **kwargs):
+    # cProfile only sees the thread it was enabled in, so each worker call gets its own profile
+    if _profiles is None:
+        return func(*args, **kwargs)
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        with _profiles_lock:
+            _profiles.append(profile)
+
+def dump_profile(path, main_profile):
+    with _profiles_lock:
+        profiles = [main_profile] + (_profiles or [])
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    try:
+        stats.dump_stats(path)
+    except OSError as e:
+        print(f'Failed to write profile {path}: {e}')
@@ -1,15 +1,23 @@
-from urllib.parse import urlencode
-import requests
 import time
-import hashlib
-import hmac
 import argparse
-import ccxt
+import cProfile
+import hashlib
 import json
+import os
+import queue
+import random
+import signal
 import sqlite3
 import sys
-from datetime import datetime, timedelta
-from prettytable import PrettyTable
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from exchange_http import signed_get
+import api_key_store
+from rate_limiter import call_ccxt
+import market_cache
+import refresh_metrics
+from refresh_metrics import timed
 
 # Define error codes
 ERROR_CODES = {
@@ -24,25 +32,74 @@ ERROR_CODES = {
 passivbot_folder = '/home/stablesail/passivbot'
 botcode_folder = '/home/stablesail/botcode'
 api_keys_file = f'{passivbot_folder}/api-keys.json'
+api_keys_db_file = f'{botcode_folder}/api_keys.db'
 maindb_file = f'{botcode_folder}/website_data.db'
 accounts_coins_file_template = f'{botcode_folder}/{{username}}_account_coins.json'
+metrics_file = f'{botcode_folder}/metrics/stablesail_db.prom'
+run_summary_file = f'{botcode_folder}/metrics/stablesail_db_summary.json'
+
+# Default number of accounts refreshed in parallel per exchange
+DEFAULT_EXCHANGE_WORKERS = {
+    'binance': 4,
+    'bybit': 4,
+}
+
+# Daemon mode refresh intervals; accounts with open positions are refreshed more often
+ACTIVE_REFRESH_SECONDS = 5 * 60
+IDLE_REFRESH_SECONDS = 30 * 60
+SCHEDULE_JITTER = 0.1
+DAEMON_POLL_SECONDS = 1
+
+# With --analytics, how often the daemon updates the portfolio analytics tables
+ANALYTICS_INTERVAL_SECONDS = 5 * 60
+
+# Closed PnL is re-fetched this far behind the ledger cursor to pick up late-posted records
+LEDGER_OVERLAP_MS = 60 * 60 * 1000
+
+# Bybit closed PnL: largest page size, longest allowed query window, windows fetched in parallel per account
+BYBIT_CLOSED_PNL_LIMIT = 100
+BYBIT_PNL_WINDOW_MS = 7 * 24 * 60 * 60 * 1000
+BYBIT_PNL_WINDOW_WORKERS = 4
+BYBIT_PNL_QUEUE_PAGES = 8
+
+# The database connection is shared by all refresh workers; reentrant so a group of writes can be held as one
+db_lock = threading.RLock()
+
+# Content hash of each coins file as last written, so unchanged positions aren't rewritten
+coins_file_hashes = {}
+coins_file_hashes_lock = threading.Lock()
+
+# Also keep every account's positions in the account_positions table; set by --mirror_positions
+mirror_positions = False
 
 # Parse command-line arguments
 parser = argparse.ArgumentParser(description='Manage cryptocurrency account data.')
 parser.add_argument('--account', type=str, help='Specific account to process. Processes all if not specified.')
-args = parser.parse_args()
-
-def load_api_keys():
+parser.add_argument('--binance_workers', type=int, default=DEFAULT_EXCHANGE_WORKERS['binance'], help='Number of Binance accounts refreshed in parallel.')
+parser.add_argument('--bybit_workers', type=int, default=DEFAULT_EXCHANGE_WORKERS['bybit'], help='Number of Bybit accounts refreshed in parallel.')
+parser.add_argument('--daemon', action='store_true', help='Keep running and refresh each account on its own schedule. SIGHUP reloads the API keys.')
+parser.add_argument('--metrics_file', type=str, default=metrics_file, help='Prometheus textfile with call latencies, request weights and errors.')
+parser.add_argument('--summary_file', type=str, default=run_summary_file, help='JSON summary of the run.')
+parser.add_argument('--mirror_positions', action='store_true', help='Also write every account\'s positions to the account_positions table.')
+parser.add_argument('--import_traded_symbols', type=str, help='Import an existing user_traded_symbols.json into the database and exit.')
+parser.add_argument('--profile', type=str, help='Write cProfile stats of the run to this file.')
+parser.add_argument('--resume', action='store_true', help='Continue the last refresh run if it was interrupted or had failed accounts, skipping the accounts it finished.')
+parser.add_argument('--analytics', action='store_true', help='Update the portfolio analytics tables (portfolio_analytics.py) after each refresh pass.')
+
+def load_api_keys(selected_account=None):
+    # With an account selected only its entry is read from the key store, not the whole file
     try:
-        with open(api_keys_file, 'r') as file:
-            return json.load(file)
+        return api_key_store.load_api_keys(api_keys_file, api_keys_db_file, selected_account)
     except Exception as e:
         print(f'Failed to load API keys: {e}')
         sys.exit(ERROR_CODES['api_keys_error'])
 
 def init_db():
     try:
-        conn = sqlite3.connect(maindb_file)
+        conn = sqlite3.connect(maindb_file, check_same_thread=False)
+        # WAL lets the website keep reading while a refresh pass is being written
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
         conn.execute('''CREATE TABLE IF NOT EXISTS account_data (
                             id INTEGER PRIMARY KEY AUTOINCREMENT,
                             account_name TEXT UNIQUE,
@@ -50,12 +107,83 @@ def init_db():
                             unrealized_pnl REAL,
                             _30day_gain REAL
                         )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS account_snapshots (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            account_name TEXT NOT NULL,
+                            ts INTEGER NOT NULL,
+                            total_balance REAL,
+                            unrealized_pnl REAL,
+                            _30day_gain REAL,
+                            position_count INTEGER
+                        )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_account_snapshots_account_ts ON account_snapshots (account_name, ts)')
+        conn.execute('''CREATE TABLE IF NOT EXISTS pnl_ledger (
+                            account_name TEXT NOT NULL,
+                            exchange TEXT NOT NULL,
+                            record_id TEXT NOT NULL,
+                            symbol TEXT NOT NULL,
+                            pnl REAL NOT NULL,
+                            ts INTEGER NOT NULL,
+                            PRIMARY KEY (account_name, record_id)
+                        )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_pnl_ledger_account_ts ON pnl_ledger (account_name, ts)')
+        conn.execute('''CREATE TABLE IF NOT EXISTS pnl_cursors (
+                            account_name TEXT PRIMARY KEY,
+                            exchange TEXT NOT NULL,
+                            fetched_until INTEGER NOT NULL
+                        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS traded_symbols (
+                            account_name TEXT NOT NULL,
+                            symbol TEXT NOT NULL,
+                            first_seen INTEGER NOT NULL,
+                            last_seen INTEGER NOT NULL,
+                            PRIMARY KEY (account_name, symbol)
+                        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS traded_symbol_checks (
+                            account_name TEXT PRIMARY KEY,
+                            last_check INTEGER NOT NULL
+                        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS account_positions (
+                            account_name TEXT NOT NULL,
+                            symbol TEXT NOT NULL,
+                            side TEXT NOT NULL,
+                            num_of_contracts REAL,
+                            entry_price REAL,
+                            upnl REAL,
+                            leverage REAL,
+                            daily_realized_pnl REAL,
+                            updated_at INTEGER NOT NULL,
+                            PRIMARY KEY (account_name, symbol, side)
+                        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS pnl_fetched_windows (
+                            account_name TEXT NOT NULL,
+                            window_start INTEGER NOT NULL,
+                            window_end INTEGER NOT NULL,
+                            PRIMARY KEY (account_name, window_start)
+                        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS refresh_runs (
+                            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            started_at INTEGER NOT NULL,
+                            finished_at INTEGER
+                        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS refresh_progress (
+                            run_id INTEGER NOT NULL,
+                            account_name TEXT NOT NULL,
+                            status TEXT NOT NULL,
+                            error_code INTEGER,
+                            updated_at INTEGER NOT NULL,
+                            PRIMARY KEY (run_id, account_name)
+                        )''')
+        conn.commit()
         return conn
     except Exception as e:
         print(f'Failed to initialize database: {e}')
         sys.exit(ERROR_CODES['db_error'])
 
 def fetch_exchange_data(api_keys, selected_account=None):
+    # Imported here: ccxt loads every exchange it supports, which only a refresh needs
+    import ccxt
+
     exchanges = []
     for account_name, api in api_keys.items():
         if selected_account and account_name != selected_account:
@@ -72,222 +200,410 @@ def fetch_exchange_data(api_keys, selected_account=None):
                 sys.exit(ERROR_CODES['api_connection_failure'])
     return exchanges
 
-def update_account_data_in_db(db_conn, account_name, total_balance, unrealized_pnl, _30day_gain):
+def update_account_data_in_db(db_conn, account_name, total_balance, unrealized_pnl, _30day_gain, position_count):
+    # Not committed here; committed with the account's progress by save_account_refresh()
     try:
-        cursor = db_conn.cursor()
-        cursor.execute('''INSERT INTO account_data (account_name, total_balance, unrealized_pnl, _30day_gain) 
-                          VALUES (?, ?, ?, ?)
-                          ON CONFLICT(account_name) 
-                          DO UPDATE SET total_balance=excluded.total_balance, unrealized_pnl=excluded.unrealized_pnl, _30day_gain=excluded._30day_gain''',
-                       (account_name, total_balance, unrealized_pnl, _30day_gain))
-        db_conn.commit()
+        with db_lock, timed('db', 'sqlite', 'account_data'):
+            cursor = db_conn.cursor()
+            cursor.execute('''INSERT INTO account_snapshots (account_name, ts, total_balance, unrealized_pnl, _30day_gain, position_count)
+                              VALUES (?, ?, ?, ?, ?, ?)''',
+                           (account_name, int(time.time() * 1000), total_balance, unrealized_pnl, _30day_gain, position_count))
+            cursor.execute('''INSERT INTO account_data (account_name, total_balance, unrealized_pnl, _30day_gain) 
+                              VALUES (?, ?, ?, ?)
+                              ON CONFLICT(account_name) 
+                              DO UPDATE SET total_balance=excluded.total_balance, unrealized_pnl=excluded.unrealized_pnl, _30day_gain=excluded._30day_gain''',
+                           (account_name, total_balance, unrealized_pnl, _30day_gain))
     except sqlite3.Error as e:
         print(f'Failed to update database for {account_name}: {e}')
         sys.exit(ERROR_CODES['db_error'])
 
-def write_account_coins_file(account_name, positions):
-    filepath = accounts_coins_file_template.format(username=account_name)
+def commit_refresh(db_conn):
     try:
-        with open(filepath, 'w') as file:
-            json.dump(positions, file, indent=4)
-    except Exception as e:
-        print(f'Failed to write account coins file for {account_name}: {e}')
-        sys.exit(ERROR_CODES['generic'])
-
-def get_closed_pnl_bybit(api_key, api_secret, start_time, end_time):
-    base_url = "https://api.bybit.com"
-    endpoint = "/v5/position/closed-pnl"
-    params = {
-        "api_key": api_key,
-        "category": "linear",
-        "start_time": start_time,
-        "end_time": end_time,
-        "timestamp": int(time.time() * 1000)
-    }
+        with db_lock, timed('db', 'sqlite', 'commit'):
+            db_conn.commit()
+    except sqlite3.Error as e:
+        print(f'Failed to commit refresh pass: {e}')
+        sys.exit(ERROR_CODES['db_error'])
 
-    # Create the signature
-    query_string = "&".join([f"{key}={value}" for key, value in sorted(params.items())])
-    signature = hmac.new(api_secret.encode(), query_string.encode(), hashlib.sha256).hexdigest()
-    params["sign"] = signature
+def coins_file_unchanged(filepath, digest):
+    # Hash of the last write per file; the file on disk is hashed the first time it is seen
+    with coins_file_hashes_lock:
+        if filepath not in coins_file_hashes:
+            try:
+                with open(filepath, 'rb') as file:
+                    coins_file_hashes[filepath] = hashlib.sha256(file.read()).hexdigest()
+            except OSError:
+                coins_file_hashes[filepath] = None
+        return coins_file_hashes[filepath] == digest
+
+def mirror_account_positions(db_conn, account_name, positions):
+    # Not committed here; refreshes commit with the account, streams commit after each update
+    try:
+        with db_lock, timed('db', 'sqlite', 'account_positions'):
+            db_conn.execute('DELETE FROM account_positions WHERE account_name = ?', (account_name,))
+            db_conn.executemany('''INSERT INTO account_positions (account_name, symbol, side, num_of_contracts, entry_price, upnl, leverage, daily_realized_pnl, updated_at)
+                                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                                [(account_name, pos['symbol'], pos['side'], pos['num_of_contracts'], pos['entry_price'], pos['upnl'],
+                                  pos['leverage'], pos.get('daily_realized_pnl'), int(time.time() * 1000)) for pos in positions])
+    except sqlite3.Error as e:
+        print(f'Failed to mirror positions for {account_name}: {e}')
+        sys.exit(ERROR_CODES['db_error'])
 
-    # Make the request
-    response = requests.get(base_url + endpoint, params=params)
-    return response.json()
+def write_account_coins_file(account_name, positions, db_conn=None):
+    # Positions are also mirrored into account_positions when a database connection is given
+    filepath = accounts_coins_file_template.format(username=account_name)
+    content = json.dumps(positions, indent=4)
+    digest = hashlib.sha256(content.encode()).hexdigest()
 
-def bybit_pnl(api_key, api_secret, username, period_days, filename="user_traded_symbols.json"):
-    end_time = int(time.time() * 1000)
-    start_time = end_time - (period_days * 24 * 60 * 60 * 1000)
-    pnl_by_coin = {}
-    total_pnl = 0
+    if db_conn is not None:
+        mirror_account_positions(db_conn, account_name, positions)
+    if coins_file_unchanged(filepath, digest):
+        return False
 
-    # Read the existing data from the JSON file
+    # Write to a temp file and rename so the website never reads a partial file
     try:
-        with open(filename, "r") as file:
-            data = json.load(file)
-    except FileNotFoundError:
-        data = {}
+        temp_path = f'{filepath}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as file:
+            file.write(content)
+        os.replace(temp_path, filepath)
+    except Exception as e:
+        print(f'Failed to write account coins file for {account_name}: {e}')
+        sys.exit(ERROR_CODES['generic'])
 
-    # Get previously traded symbols for the user, if available
-    previous_traded_symbols = data.get(username, {}).get("traded_symbols", [])
-    traded_symbols = set(previous_traded_symbols)  # Use a set to avoid duplicates
+    with coins_file_hashes_lock:
+        coins_file_hashes[filepath] = digest
+    return True
 
+def get_ledger_cursor(db_conn, account_name):
+    with db_lock:
+        row = db_conn.execute('SELECT fetched_until FROM pnl_cursors WHERE account_name = ?', (account_name,)).fetchone()
+    return row[0] if row else None
 
-    while start_time < end_time:
-        batch_end_time = min(start_time + (7 * 24 * 60 * 60 * 1000), end_time)
-        result = get_closed_pnl_bybit(api_key, api_secret, start_time, batch_end_time)
-
-        if result['retCode'] == 0:
-            for record in result['result']['list']:
-                symbol = record['symbol']
-                pnl = float(record['closedPnl'])
-                pnl_by_coin[symbol] = pnl_by_coin.get(symbol, 0) + pnl
-                total_pnl += pnl
-                traded_symbols.add(symbol)  # Add symbol to the set of traded symbols
-        else:
-            print(f"Error: {result['retMsg']}")
+def ledger_fetch_start(db_conn, account_name, period_start):
+    # Only fetch what the ledger doesn't already hold, never further back than the reporting period
+    fetched_until = get_ledger_cursor(db_conn, account_name)
+    if fetched_until is None:
+        return period_start
+    return max(period_start, fetched_until - LEDGER_OVERLAP_MS)
 
-        start_time = batch_end_time
+def store_ledger_records(db_conn, account_name, exchange_id, records, fetched_until):
+    try:
+        with db_lock, timed('db', 'sqlite', 'pnl_ledger'):
+            db_conn.executemany('''INSERT OR IGNORE INTO pnl_ledger (account_name, exchange, record_id, symbol, pnl, ts)
+                                   VALUES (?, ?, ?, ?, ?, ?)''',
+                                [(account_name, exchange_id, record_id, symbol, pnl, ts) for record_id, symbol, pnl, ts in records])
+            db_conn.execute('''INSERT INTO pnl_cursors (account_name, exchange, fetched_until) VALUES (?, ?, ?)
+                               ON CONFLICT(account_name) DO UPDATE SET exchange=excluded.exchange, fetched_until=excluded.fetched_until''',
+                            (account_name, exchange_id, fetched_until))
+    except sqlite3.Error as e:
+        print(f'Failed to update PnL ledger for {account_name}: {e}')
+        sys.exit(ERROR_CODES['db_error'])
 
-    # Update the JSON file with the combined traded symbols
-    data[username] = {
-        "last_check_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "traded_symbols": list(traded_symbols)
-    }
-    with open(filename, "w") as file:
-        json.dump(data, file, indent=4)
+def ledger_pnl(db_conn, account_name, since_ts):
+    with db_lock:
+        rows = db_conn.execute('''SELECT symbol, SUM(pnl) FROM pnl_ledger
+                                  WHERE account_name = ? AND ts >= ?
+                                  GROUP BY symbol''', (account_name, since_ts)).fetchall()
+    pnl_by_coin = {symbol: pnl for symbol, pnl in rows}
+    return {"total_pnl": sum(pnl_by_coin.values()), "pnl_by_coin": pnl_by_coin}
 
-    return {"total_pnl": total_pnl, "pnl_by_coin": pnl_by_coin}
-       
-def binance_signature(query_string, api_secret):
-    return hmac.new(api_secret.encode(), query_string.encode(), hashlib.sha256).hexdigest()
+def utc_midnight_ms():
+    now = datetime.now(timezone.utc)
+    return int(now.replace(hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)
 
-def get_binance_futures_trade_history(api_key, api_secret, symbol, start_time, end_time):
-    base_url = "https://fapi.binance.com"
-    endpoint = "/fapi/v1/userTrades"
+def get_closed_pnl_bybit(api_key, api_secret, start_time, end_time, cursor=None):
     params = {
-        "symbol": symbol,
+        "category": "linear",
         "startTime": start_time,
         "endTime": end_time,
-        "timestamp": int(time.time() * 1000)
+        "limit": BYBIT_CLOSED_PNL_LIMIT
     }
-    query_string = urlencode(params)
-    signature = binance_signature(query_string, api_secret)
-    params["signature"] = signature
-    headers = {
-        "X-MBX-APIKEY": api_key
-    }
-    response = requests.get(base_url + endpoint, params=params, headers=headers)
-    data = response.json()
-    if 'code' in data:
-        print(f"Error fetching trades for {symbol}: {data['msg']}")
-    return data
-
-def get_traded_symbols_binance(api_key, api_secret, duration_days):
-    end_time = int(time.time() * 1000)
-    start_time = end_time - (duration_days * 24 * 60 * 60 * 1000)
-
-    response = requests.get("https://fapi.binance.com/fapi/v1/exchangeInfo")
-    symbols = [symbol['symbol'] for symbol in response.json()['symbols']]
-
-    traded_symbols = set()
-    for symbol in symbols:
-        temp_start_time = start_time
-        while temp_start_time < end_time:
-            batch_end_time = min(temp_start_time + (7 * 24 * 60 * 60 * 1000), end_time)
-            trades = get_binance_futures_trade_history(api_key, api_secret, symbol, temp_start_time, batch_end_time)
-            if isinstance(trades, list) and len(trades) > 0:
-                traded_symbols.add(symbol)
-                break  # No need to check further if we already found trades for this symbol
-            temp_start_time = batch_end_time
-
-    return list(traded_symbols)
-
-def binance_futures_pnl(api_key, api_secret, symbol, period_days):
-    end_time = int(time.time() * 1000)
-    start_time = end_time - (period_days * 24 * 60 * 60 * 1000)
-    total_pnl = 0
-
+    if cursor:
+        params["cursor"] = cursor
+    return signed_get('bybit', '/v5/position/closed-pnl', api_key, api_secret, params)
+
+def fetch_closed_pnl_window_bybit(api_key, api_secret, start_time, end_time, put_page):
+    # Follows nextPageCursor until the window is exhausted; returns False if the exchange reported an error
+    cursor = None
+    while True:
+        result = get_closed_pnl_bybit(api_key, api_secret, start_time, end_time, cursor)
+        if result['retCode'] != 0:
+            print(f"Error: {result['retMsg']}")
+            return False
+        cursor = result['result'].get('nextPageCursor')
+        put_page(result['result']['list'], not cursor)
+        if not cursor:
+            return True
+
+def split_pnl_windows(start_time, end_time, fetched_windows=()):
+    # 7-day windows covering start_time..end_time; ranges fetched by an earlier run come back marked as done
+    windows = []
+    for fetched_start, fetched_end in sorted(fetched_windows):
+        if fetched_end <= start_time or fetched_start >= end_time:
+            continue
+        while start_time < fetched_start:
+            windows.append((start_time, min(start_time + BYBIT_PNL_WINDOW_MS, fetched_start), False))
+            start_time = windows[-1][1]
+        windows.append((start_time, min(fetched_end, end_time), True))
+        start_time = windows[-1][1]
     while start_time < end_time:
-        batch_end_time = min(start_time + (24 * 60 * 60 * 1000), end_time)
-        trades = get_binance_futures_trade_history(api_key, api_secret, symbol, start_time, batch_end_time)
-
-        if isinstance(trades, list):
-            for trade in trades:
-                pnl = float(trade['realizedPnl'])
-                total_pnl += pnl
-        else:
-            print(f"Error: {trades}")
-
-        start_time = batch_end_time
-
-    return total_pnl
+        windows.append((start_time, min(start_time + BYBIT_PNL_WINDOW_MS, end_time), False))
+        start_time = windows[-1][1]
+    return windows
+
+def iter_closed_pnl_bybit(api_key, api_secret, start_time, end_time, fetched_windows=()):
+    """Yields (records, fetched_until, completed_window) per page of closed PnL between start_time and end_time.
+
+    The 7-day windows are fetched concurrently and pages arrive in completion order.
+    fetched_until only covers windows that are complete with every window before them.
+    completed_window is (start, end) on the last page of a window fetched without errors, otherwise None.
+    Windows inside fetched_windows are not fetched again.
+    """
+    windows = split_pnl_windows(start_time, end_time, fetched_windows)
+    if not windows:
+        return
+
+    # Bounded so fetching pauses while the caller is still storing earlier pages
+    pages = queue.Queue(maxsize=BYBIT_PNL_QUEUE_PAGES)
+    stop = threading.Event()
+    account_name = refresh_metrics.current_account()
+
+    def fetch_window(index):
+        refresh_metrics.set_account(account_name)
+
+        def put_page(records, last_page):
+            while not stop.is_set():
+                try:
+                    pages.put((index, records, last_page), timeout=1)
+                    return
+                except queue.Full:
+                    pass
+            raise RuntimeError('Closed PnL fetch abandoned')
+
+        try:
+            if not fetch_closed_pnl_window_bybit(api_key, api_secret, windows[index][0], windows[index][1], put_page):
+                put_page(None, True)
+        except Exception as e:
+            if not stop.is_set():
+                print(f"Error fetching closed PnL: {e}")
+                put_page(None, True)
+
+    completed = [done for _, _, done in windows]
+    pending = [index for index, (_, _, done) in enumerate(windows) if not done]
+    next_window = 0
+    failed = False
+
+    def advance():
+        nonlocal next_window
+        while not failed and next_window < len(windows) and completed[next_window]:
+            next_window += 1
+        return windows[next_window - 1][1] if next_window else windows[0][0]
+
+    if not pending:
+        yield [], advance(), None
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(BYBIT_PNL_WINDOW_WORKERS, len(pending)), thread_name_prefix='bybit-pnl')
+    try:
+        for index in pending:
+            executor.submit(fetch_window, index)
+
+        remaining = len(pending)
+        while remaining:
+            index, records, last_page = pages.get()
+            if last_page:
+                remaining -= 1
+                # A failed window leaves the cursor in front of it so the next run retries it
+                failed = failed or records is None
+                completed[index] = records is not None
+            completed_window = windows[index][:2] if last_page and records is not None else None
+            yield records or [], advance(), completed_window
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def save_traded_symbols(db_conn, account_name, records):
+    # Row-level upserts from ledger records; not committed here, like the rest of the account refresh
+    symbol_times = {}
+    for _, symbol, _, ts in records:
+        first_seen, last_seen = symbol_times.get(symbol, (ts, ts))
+        symbol_times[symbol] = (min(first_seen, ts), max(last_seen, ts))
+    try:
+        with db_lock, timed('db', 'sqlite', 'traded_symbols'):
+            db_conn.executemany('''INSERT INTO traded_symbols (account_name, symbol, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                                   ON CONFLICT(account_name, symbol)
+                                   DO UPDATE SET first_seen=MIN(first_seen, excluded.first_seen), last_seen=MAX(last_seen, excluded.last_seen)''',
+                                [(account_name, symbol, first_seen, last_seen) for symbol, (first_seen, last_seen) in symbol_times.items()])
+            db_conn.execute('''INSERT INTO traded_symbol_checks (account_name, last_check) VALUES (?, ?)
+                               ON CONFLICT(account_name) DO UPDATE SET last_check=excluded.last_check''',
+                            (account_name, int(time.time() * 1000)))
+    except sqlite3.Error as e:
+        print(f'Failed to update traded symbols for {account_name}: {e}')
+        sys.exit(ERROR_CODES['db_error'])
 
-def update_traded_symbols_binance(api_key, api_secret, username, filename="user_traded_symbols.json"):
-    # Read the existing data from the JSON file
+def import_traded_symbols(db_conn, filename):
+    # One-time import of the user_traded_symbols.json file the refresh used to write
     try:
         with open(filename, "r") as file:
             data = json.load(file)
-    except FileNotFoundError:
-        data = {}
-
-    # Get the last check date and previously traded symbols for the user, if available
-    user_data = data.get(username, {})
-    last_check_date = user_data.get("last_check_date", None)
-    previous_traded_symbols = user_data.get("traded_symbols", [])
-
-    if last_check_date:
-        last_check_datetime = datetime.strptime(last_check_date, "%Y-%m-%d %H:%M:%S")
-        duration_days = (datetime.now() - last_check_datetime).days
-    else:
-        duration_days = 30  # Default to 30 days if no previous check date
-
-    # Get traded symbols since the last check date
-    traded_symbols = get_traded_symbols_binance(api_key, api_secret, duration_days)
-
-    # Combine with previously traded symbols and remove duplicates
-    combined_traded_symbols = list(set(traded_symbols + previous_traded_symbols))
-
-    # Update the JSON file with the current datetime and combined traded symbols
-    data[username] = {
-        "last_check_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "traded_symbols": combined_traded_symbols
-    }
-    with open(filename, "w") as file:
-        json.dump(data, file, indent=4)
-
-    return combined_traded_symbols
-
-def calculate_pnl_binance(api_key, api_secret, traded_symbols, duration_days):
-    pnl_by_coin = {}
-    total_pnl = 0
+    except (OSError, ValueError) as e:
+        print(f'Failed to read traded symbols file {filename}: {e}')
+        sys.exit(ERROR_CODES['generic'])
 
-    for symbol in traded_symbols:
-        pnl = binance_futures_pnl(api_key, api_secret, symbol, duration_days)
-        pnl_by_coin[symbol] = pnl
-        total_pnl += pnl
+    for account_name, entry in data.items():
+        last_check = int(datetime.strptime(entry["last_check_date"], "%Y-%m-%d %H:%M:%S").timestamp() * 1000)
+        try:
+            with db_lock:
+                db_conn.executemany('''INSERT INTO traded_symbols (account_name, symbol, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                                       ON CONFLICT(account_name, symbol)
+                                       DO UPDATE SET first_seen=MIN(first_seen, excluded.first_seen), last_seen=MAX(last_seen, excluded.last_seen)''',
+                                    [(account_name, symbol, last_check, last_check) for symbol in entry["traded_symbols"]])
+                db_conn.execute('''INSERT INTO traded_symbol_checks (account_name, last_check) VALUES (?, ?)
+                                   ON CONFLICT(account_name) DO UPDATE SET last_check=MAX(last_check, excluded.last_check)''',
+                                (account_name, last_check))
+        except sqlite3.Error as e:
+            print(f'Failed to import traded symbols for {account_name}: {e}')
+            sys.exit(ERROR_CODES['db_error'])
+    commit_refresh(db_conn)
+    return len(data)
+
+def get_fetched_windows(db_conn, account_name):
+    with db_lock:
+        return db_conn.execute('SELECT window_start, window_end FROM pnl_fetched_windows WHERE account_name = ?', (account_name,)).fetchall()
+
+def save_fetched_window(db_conn, account_name, window, fetched_until):
+    # Windows the ledger cursor has passed are covered by the cursor and forgotten
+    try:
+        with db_lock, timed('db', 'sqlite', 'pnl_windows'):
+            if window[1] > fetched_until:
+                db_conn.execute('INSERT OR REPLACE INTO pnl_fetched_windows (account_name, window_start, window_end) VALUES (?, ?, ?)',
+                                (account_name, window[0], window[1]))
+            db_conn.execute('DELETE FROM pnl_fetched_windows WHERE account_name = ? AND window_end <= ?', (account_name, fetched_until))
+    except sqlite3.Error as e:
+        print(f'Failed to checkpoint closed PnL window for {account_name}: {e}')
+        sys.exit(ERROR_CODES['db_error'])
 
-    return pnl_by_coin, total_pnl
+def store_ledger_page(db_conn, account_name, exchange_id, records, fetched_until, window=None):
+    # One lock hold, so another worker's commit never splits a page from its traded symbols or window checkpoint
+    with db_lock:
+        store_ledger_records(db_conn, account_name, exchange_id, records, fetched_until)
+        save_traded_symbols(db_conn, account_name, records)
+        if window:
+            save_fetched_window(db_conn, account_name, window, fetched_until)
 
-def fetch_and_update_account_data(exchange, account_name, db_conn):
+def bybit_pnl(api_key, api_secret, username, period_days, db_conn):
+    end_time = int(time.time() * 1000)
+    period_start = end_time - (period_days * 24 * 60 * 60 * 1000)
+    start_time = ledger_fetch_start(db_conn, username, period_start)
+
+    # Each page is stored as it arrives, so the whole period is never held in memory.
+    # Every finished window is committed, so a run that stops halfway doesn't fetch it again.
+    for page, fetched_until, window in iter_closed_pnl_bybit(api_key, api_secret, start_time, end_time, get_fetched_windows(db_conn, username)):
+        records = [(record['orderId'], record['symbol'], float(record['closedPnl']), int(record['createdTime'])) for record in page]
+        # The newest window can still receive late-posted records, so it is left to the cursor overlap
+        if window and window[1] > end_time - LEDGER_OVERLAP_MS:
+            window = None
+        store_ledger_page(db_conn, username, 'bybit', records, fetched_until, window)
+        if window:
+            commit_refresh(db_conn)
+
+    return ledger_pnl(db_conn, username, period_start)
+
+def iter_binance_income_history(api_key, api_secret, start_time, end_time, income_type="REALIZED_PNL", limit=1000):
+    # Yields (records, fetched_until) per page; fetched_until is the time up to which the records are complete
+    seen_ids = set()
+
+    # Page forward by time; records sharing the boundary timestamp are skipped by tranId
+    while start_time < end_time:
+        params = {
+            "incomeType": income_type,
+            "startTime": start_time,
+            "endTime": end_time,
+            "limit": limit
+        }
+        data = signed_get('binance', '/fapi/v1/income', api_key, api_secret, params)
+        if isinstance(data, dict) and 'code' in data:
+            print(f"Error fetching income history: {data['msg']}")
+            return
+
+        records = [record for record in data if record['tranId'] not in seen_ids]
+        seen_ids.update(record['tranId'] for record in records)
+
+        if len(data) < limit:
+            yield records, end_time
+            return
+        last_time = data[-1]['time']
+        # Records at last_time may continue on the next page, so the page is only complete before it
+        yield records, last_time
+        start_time = last_time if last_time > start_time else start_time + 1
+
+def binance_pnl(api_key, api_secret, username, period_days, db_conn):
+    end_time = int(time.time() * 1000)
+    period_start = end_time - (period_days * 24 * 60 * 60 * 1000)
+    start_time = ledger_fetch_start(db_conn, username, period_start)
+
+    # A single pass over realized PnL income finds the traded symbols and their PnL together.
+    # Every page is committed, so a run that stops halfway continues from the last page.
+    for income, fetched_until in iter_binance_income_history(api_key, api_secret, start_time, end_time):
+        records = [(str(record['tranId']), record['symbol'], float(record['income']), record['time']) for record in income]
+        store_ledger_page(db_conn, username, 'binance', records, fetched_until)
+        commit_refresh(db_conn)
+
+    return ledger_pnl(db_conn, username, period_start)
+
+def position_market_id(exchange, pos):
+    # The raw exchange id the ledger is keyed by. The market table can come from a cache that predates a new
+    # listing, so exchange.market() could raise for an open position; the id in the raw response never does.
+    if pos['info'].get('symbol'):
+        return pos['info']['symbol']
+    market = (exchange.markets or {}).get(pos['symbol'])
+    return market['id'] if market else pos['symbol']
+
+def save_account_refresh(db_conn, account_name, total_balance, unrealized_pnl, _30day_gain, positions, run_id=None):
+    # The account's rows and its progress row are written under one lock hold and committed together.
+    # Any failure rolls them back to the savepoint, so a failed account leaves no snapshot behind.
+    with db_lock:
+        try:
+            db_conn.execute('SAVEPOINT account_refresh')
+        except sqlite3.Error as e:
+            print(f'Failed to update database for {account_name}: {e}')
+            sys.exit(ERROR_CODES['db_error'])
+        try:
+            update_account_data_in_db(db_conn, account_name, total_balance, unrealized_pnl, _30day_gain, len(positions))
+            if mirror_positions:
+                mirror_account_positions(db_conn, account_name, positions)
+            if run_id is not None:
+                record_account_result(db_conn, run_id, account_name)
+        except BaseException:
+            db_conn.execute('ROLLBACK TO account_refresh')
+            db_conn.execute('RELEASE account_refresh')
+            raise
+        db_conn.execute('RELEASE account_refresh')
+        commit_refresh(db_conn)
+
+def fetch_and_update_account_data(exchange, account_name, db_conn, run_id=None):
+    # Tags the exchange calls and writes below with this account in the run metrics
+    refresh_metrics.set_account(account_name)
     try:
+        market_cache.load_markets(exchange)
+
         if exchange.id == 'bybit':
-            balance = exchange.fetch_balance()
+            balance = call_ccxt(exchange, 'fetch_balance')
             total_balance = balance['total'].get('USDT', 0)
-            pnl_result = bybit_pnl(api_key=exchange.apiKey, api_secret=exchange.secret, username=account_name, period_days=30)
+            pnl_result = bybit_pnl(api_key=exchange.apiKey, api_secret=exchange.secret, username=account_name, period_days=30, db_conn=db_conn)
             
         elif exchange.id == 'binance':
-            balance = exchange.fetch_balance({'type': 'future'})
+            balance = call_ccxt(exchange, 'fetch_balance', {'type': 'future'})
             total_balance = balance['info']['totalWalletBalance']
-            traded_symbols = update_traded_symbols_binance(api_key=exchange.apiKey, api_secret=exchange.secret, username=account_name)
-            pnl_result, pnl_result['total_pnl'] = calculate_pnl_binance(api_key=exchange.apiKey, api_secret=exchange.secret, traded_symbols=traded_symbols, duration_days=30)
+            pnl_result = binance_pnl(api_key=exchange.apiKey, api_secret=exchange.secret, username=account_name, period_days=30, db_conn=db_conn)
 
-        positions = exchange.fetch_positions()
+        positions = call_ccxt(exchange, 'fetch_positions')
         active_positions = [position for position in positions if position['contracts'] > 0]
  
         _30day_gain =  pnl_result['total_pnl']
 
-        # Update the account data in the database
-        update_account_data_in_db(db_conn, account_name, total_balance, sum(pos['unrealizedPnl'] for pos in active_positions), _30day_gain)
+        # Realized PnL since UTC midnight, from the ledger that was just brought up to date
+        daily_pnl_by_coin = ledger_pnl(db_conn, account_name, utc_midnight_ms())['pnl_by_coin']
 
         # Prepare and write account-specific positions data
         accounts_coins_data = [{
@@ -297,27 +613,251 @@ def fetch_and_update_account_data(exchange, account_name, db_conn):
             "entry_price": pos['entryPrice'],
             "upnl": pos['unrealizedPnl'],
             "leverage": pos['leverage'],
-            "daily_realized_pnl": sum(trade['profit'] for trade in exchange.fetch_my_trades(pos['symbol']) if 'profit' in trade)
+            "daily_realized_pnl": daily_pnl_by_coin.get(position_market_id(exchange, pos), 0)
         } for pos in active_positions]
 
+        # Nothing of the account is written until everything above has succeeded; the file is rewritten as is on a retry
         write_account_coins_file(account_name, accounts_coins_data)
+        save_account_refresh(db_conn, account_name, total_balance, sum(pos['unrealizedPnl'] for pos in active_positions),
+                             _30day_gain, accounts_coins_data, run_id)
 
         print(f"Updated {account_name}: Total Balance: {total_balance}, Active Positions: {len(active_positions)}")
+        return len(active_positions)
 
     except Exception as e:
         print(f"Error updating account {account_name}: {e}")
         sys.exit(ERROR_CODES['generic'])
 
-def main():
-    api_keys = load_api_keys()
-    db_conn = init_db()
-    exchanges = fetch_exchange_data(api_keys, args.account)
-    
-    for account_name, exchange in exchanges:
-        fetch_and_update_account_data(exchange, account_name, db_conn)
-    
-    db_conn.close()
-    print(f'Operation completed. Accounts updated: {len(exchanges)}.')
+def update_analytics(db_conn):
+    # Imported here so runs without --analytics don't load NumPy
+    import portfolio_analytics
+
+    try:
+        with db_lock, timed('db', 'sqlite', 'analytics'):
+            count = portfolio_analytics.run_analytics(db_conn)
+    except sqlite3.Error as e:
+        # The refreshed account data is already committed; the analytics are updated again next pass
+        print(f'Failed to update analytics: {e}')
+        return
+    print(f'Analytics updated for {count} accounts.')
+
+def start_refresh_run(db_conn, resume=False):
+    # Returns the run id and the accounts it has already finished
+    try:
+        with db_lock:
+            if resume:
+                # The latest run is continued if it was interrupted or left failed accounts behind
+                row = db_conn.execute('''SELECT run_id FROM refresh_runs
+                                         WHERE run_id = (SELECT MAX(run_id) FROM refresh_runs)
+                                         AND (finished_at IS NULL OR run_id IN (SELECT run_id FROM refresh_progress WHERE status = 'failed'))''').fetchone()
+                if row:
+                    done = db_conn.execute("SELECT account_name FROM refresh_progress WHERE run_id = ? AND status = 'done'", (row[0],)).fetchall()
+                    return row[0], {account_name for account_name, in done}
+                print('No interrupted refresh run to resume; starting a new one.')
+            cursor = db_conn.execute('INSERT INTO refresh_runs (started_at) VALUES (?)', (int(time.time() * 1000),))
+            db_conn.commit()
+            return cursor.lastrowid, set()
+    except sqlite3.Error as e:
+        print(f'Failed to start refresh run: {e}')
+        sys.exit(ERROR_CODES['db_error'])
+
+def record_account_result(db_conn, run_id, account_name, error_code=None):
+    # Not committed here; a done row is committed together with the account's data by save_account_refresh()
+    try:
+        with db_lock, timed('db', 'sqlite', 'refresh_progress'):
+            db_conn.execute('''INSERT INTO refresh_progress (run_id, account_name, status, error_code, updated_at) VALUES (?, ?, ?, ?, ?)
+                               ON CONFLICT(run_id, account_name) DO UPDATE SET status=excluded.status, error_code=excluded.error_code, updated_at=excluded.updated_at''',
+                            (run_id, account_name, 'failed' if error_code else 'done', error_code, int(time.time() * 1000)))
+    except sqlite3.Error as e:
+        print(f'Failed to record refresh progress for {account_name}: {e}')
+        sys.exit(ERROR_CODES['db_error'])
+
+def finish_refresh_run(db_conn, run_id):
+    try:
+        with db_lock:
+            db_conn.execute('UPDATE refresh_runs SET finished_at = ? WHERE run_id = ?', (int(time.time() * 1000), run_id))
+    except sqlite3.Error as e:
+        print(f'Failed to finish refresh run: {e}')
+        sys.exit(ERROR_CODES['db_error'])
+    commit_refresh(db_conn)
+
+def refresh_account(exchange, account_name, db_conn, run_id):
+    # A failing account is recorded with its error code and the other accounts carry on; returns the code, 0 on success
+    try:
+        fetch_and_update_account_data(exchange, account_name, db_conn, run_id)
+        return 0
+    except SystemExit as e:
+        error_code = e.code if isinstance(e.code, int) and e.code else ERROR_CODES['generic']
+
+    print(f'Account {account_name} failed with error code {error_code}.')
+    try:
+        record_account_result(db_conn, run_id, account_name, error_code)
+        commit_refresh(db_conn)
+    except SystemExit:
+        pass  # The database error has been printed
+    return error_code
+
+def create_executors(workers):
+    # One bounded pool per exchange so Binance and Bybit accounts refresh side by side
+    return {exchange_id: ThreadPoolExecutor(max_workers=max(1, count), thread_name_prefix=f'refresh-{exchange_id}')
+            for exchange_id, count in workers.items()}
+
+def refresh_accounts(exchanges, db_conn, workers, run_id):
+    # Returns {account_name: error_code} of the accounts that failed
+    executors = create_executors(workers)
+    try:
+        futures = [(account_name, executors[exchange.id].submit(refresh_metrics.profiled, refresh_account, exchange, account_name, db_conn, run_id))
+                   for account_name, exchange in exchanges]
+        failures = {}
+        for account_name, future in futures:
+            error_code = future.result()
+            if error_code:
+                failures[account_name] = error_code
+        return failures
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def next_refresh_delay(position_count):
+    interval = ACTIVE_REFRESH_SECONDS if position_count else IDLE_REFRESH_SECONDS
+    return interval * random.uniform(1 - SCHEDULE_JITTER, 1 + SCHEDULE_JITTER)
+
+def run_daemon(db_conn, workers, metrics_files, selected_account=None, analytics=False):
+    reload_requested = threading.Event()
+    stop_requested = threading.Event()
+    signal.signal(signal.SIGHUP, lambda signum, frame: reload_requested.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_requested.set())
+
+    # Exchange clients stay alive between refreshes so their sessions and markets stay warm
+    api_keys = {}
+    exchanges = {}
+    schedule = {}
+    in_flight = {}
+    analytics_due = time.monotonic()
+    executors = create_executors(workers)
+
+    def sync_accounts(new_api_keys):
+        for account_name in list(exchanges):
+            if new_api_keys.get(account_name) != api_keys.get(account_name):
+                del exchanges[account_name]
+                schedule.pop(account_name, None)
+        added = {name: api for name, api in new_api_keys.items() if name not in exchanges}
+        for account_name, exchange in fetch_exchange_data(added, selected_account):
+            exchanges[account_name] = exchange
+            # Spread first refreshes out so the accounts don't all hit the API at once
+            schedule[account_name] = time.monotonic() + random.uniform(0, ACTIVE_REFRESH_SECONDS)
+        api_keys.clear()
+        api_keys.update(new_api_keys)
+
+    try:
+        sync_accounts(load_api_keys(selected_account))
+        print(f'Daemon started. Accounts scheduled: {len(exchanges)}.')
+
+        while not stop_requested.is_set():
+            if reload_requested.is_set():
+                reload_requested.clear()
+                try:
+                    sync_accounts(load_api_keys(selected_account))
+                    print(f'API keys reloaded. Accounts scheduled: {len(exchanges)}.')
+                except SystemExit:
+                    print('Keeping the current accounts.')
+
+            now = time.monotonic()
+            for account_name, due in list(schedule.items()):
+                if due <= now:
+                    exchange = exchanges[account_name]
+                    future = executors[exchange.id].submit(refresh_metrics.profiled, fetch_and_update_account_data, exchange, account_name, db_conn)
+                    in_flight[future] = account_name
+                    del schedule[account_name]
+
+            timeout = min([DAEMON_POLL_SECONDS] + [due - now for due in schedule.values()])
+            if not in_flight:
+                time.sleep(max(0, timeout))
+                continue
+
+            done, _ = wait(in_flight, timeout=max(0, timeout), return_when=FIRST_COMPLETED)
+            for future in done:
+                account_name = in_flight.pop(future)
+                try:
+                    position_count = future.result()
+                except (Exception, SystemExit):
+                    # The error has been printed; try again on the idle schedule
+                    position_count = 0
+                if account_name in exchanges and account_name not in schedule:
+                    schedule[account_name] = time.monotonic() + next_refresh_delay(position_count)
+            if done:
+                commit_refresh(db_conn)
+                if analytics and time.monotonic() >= analytics_due:
+                    update_analytics(db_conn)
+                    analytics_due = time.monotonic() + ANALYTICS_INTERVAL_SECONDS
+                write_run_metrics(metrics_files, {'mode': 'daemon', 'accounts_scheduled': len(exchanges)})
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+        commit_refresh(db_conn)
+    print('Daemon stopped.')
+
+def write_run_metrics(metrics_files, extra=None):
+    metrics_path, summary_path = metrics_files
+    refresh_metrics.write_prometheus(metrics_path)
+    refresh_metrics.write_summary(summary_path, extra)
+
+def main(argv=None):
+    global mirror_positions
+    args = parser.parse_args(argv)
+    mirror_positions = args.mirror_positions
+    metrics_files = (args.metrics_file, args.summary_file)
+
+    profile = None
+    if args.profile:
+        refresh_metrics.enable_profiling()
+        profile = cProfile.Profile()
+        profile.enable()
+
+    try:
+        db_conn = init_db()
+        workers = {'binance': args.binance_workers, 'bybit': args.bybit_workers}
+
+        if args.import_traded_symbols:
+            imported = import_traded_symbols(db_conn, args.import_traded_symbols)
+            db_conn.close()
+            print(f'Imported traded symbols of {imported} accounts.')
+            return
+
+        if args.daemon:
+            run_daemon(db_conn, workers, metrics_files, args.account, args.analytics)
+            db_conn.close()
+            return
+
+        api_keys = load_api_keys(args.account)
+        exchanges = fetch_exchange_data(api_keys, args.account)
+
+        # Each account is committed as it finishes, so an interrupted run can continue with --resume
+        run_id, done = start_refresh_run(db_conn, args.resume)
+        if done:
+            print(f'Resuming refresh run {run_id}. Accounts already done: {len(done)}.')
+        pending = [(account_name, exchange) for account_name, exchange in exchanges if account_name not in done]
+
+        failures = refresh_accounts(pending, db_conn, workers, run_id)
+        finish_refresh_run(db_conn, run_id)
+        if args.analytics:
+            update_analytics(db_conn)
+
+        db_conn.close()
+        updated = len(pending) - len(failures)
+        write_run_metrics(metrics_files, {'mode': 'single', 'run_id': run_id, 'accounts_updated': updated,
+                                          'accounts_failed': len(failures), 'accounts_skipped': len(exchanges) - len(pending)})
+        print(f'Operation completed. Accounts updated: {updated}, failed: {len(failures)}.')
+        for account_name, error_code in failures.items():
+            print(f'Failed account {account_name}: error code {error_code}.')
+        if failures:
+            # Exit with the first failure's code, as a single failing account used to
+            sys.exit(next(iter(failures.values())))
+    finally:
+        if profile:
+            profile.disable()
+            refresh_metrics.dump_profile(args.profile, profile)
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+
+import websockets
+
+import exchange_http
+import market_cache
+import stablesail_db
+from exchange_http import hmac_sha256, send_request
+from rate_limiter import call_ccxt
+from stablesail_db import ERROR_CODES, db_lock, fetch_exchange_data, init_db, ledger_pnl, load_api_keys, position_market_id, utc_midnight_ms, write_account_coins_file
+
+# Private stream endpoints
+BINANCE_WS_URL = 'wss://fstream.binance.com/ws'
+BYBIT_WS_URL = 'wss://stream.bybit.com/v5/private'
+
+# Binance listen keys expire after 60 minutes without a keepalive
+LISTEN_KEY_KEEPALIVE_SECONDS = 30 * 60
+BYBIT_PING_SECONDS = 20
+BYBIT_AUTH_EXPIRY_MS = 10 * 1000
+RECONNECT_DELAY_SECONDS = 5
+SNAPSHOT_RETRY_SECONDS = 60
+
+# Bybit positionIdx: 0 is one-way mode, 1 and 2 are the long and short sides in hedge mode
+BYBIT_HEDGE_SIDES = {1: 'long', 2: 'short'}
+
+class AccountState:
+    def __init__(self, account_name, exchange):
+        self.account_name = account_name
+        self.exchange = exchange
+        self.total_balance = None
+        self.positions = {}
+        # Raw exchange id of every symbol seen, so a market missing from a cached table still maps back
+        self.market_ids = {}
+
+    def symbol_for(self, market_id):
+        # Same unified symbols as the refresh writes; raw ids when markets aren't loaded
+        if not self.exchange.markets:
+            return market_id
+        symbol = self.exchange.safe_market(market_id, None, None, 'swap')['symbol']
+        self.market_ids[symbol] = market_id
+        return symbol
+
+    def market_id(self, symbol):
+        if symbol in self.market_ids:
+            return self.market_ids[symbol]
+        market = (self.exchange.markets or {}).get(symbol)
+        return market['id'] if market else symbol
+
+    def load_snapshot(self):
+        # Start from REST so fields the streams don't repeat (e.g. leverage) are known
+        market_cache.load_markets(self.exchange)
+        if self.exchange.id == 'binance':
+            balance = call_ccxt(self.exchange, 'fetch_balance', {'type': 'future'})
+            self.total_balance = float(balance['info']['totalWalletBalance'])
+        else:
+            balance = call_ccxt(self.exchange, 'fetch_balance')
+            self.total_balance = balance['total'].get('USDT', 0)
+        for pos in call_ccxt(self.exchange, 'fetch_positions'):
+            if pos['contracts'] > 0:
+                self.market_ids[pos['symbol']] = position_market_id(self.exchange, pos)
+                self.positions[(pos['symbol'], pos['side'])] = {
+                    "symbol": pos['symbol'],
+                    "side": pos['side'],
+                    "num_of_contracts": pos['contracts'],
+                    "entry_price": pos['entryPrice'],
+                    "upnl": pos['unrealizedPnl'],
+                    "leverage": pos['leverage'],
+                }
+
+    def update_position(self, symbol, side, contracts, entry_price, upnl, leverage=None):
+        key = (symbol, side)
+        if contracts == 0:
+            return self.positions.pop(key, None) is not None
+        previous = self.positions.get(key, {})
+        position = {
+            "symbol": symbol,
+            "side": side,
+            "num_of_contracts": contracts,
+            "entry_price": entry_price,
+            "upnl": upnl,
+            "leverage": leverage if leverage is not None else previous.get('leverage'),
+        }
+        self.positions[key] = position
+        return position != previous
+
+    def set_leverage(self, symbol, leverage):
+        changed = False
+        for (position_symbol, _), position in self.positions.items():
+            if position_symbol == symbol and position['leverage'] != leverage:
+                position['leverage'] = leverage
+                changed = True
+        return changed
+
+    def apply_binance(self, event):
+        changed = False
+        if event.get('e') == 'ACCOUNT_UPDATE':
+            for balance in event['a'].get('B', []):
+                if balance['a'] == 'USDT' and float(balance['wb']) != self.total_balance:
+                    self.total_balance = float(balance['wb'])
+                    changed = True
+            for pos in event['a'].get('P', []):
+                amount = float(pos['pa'])
+                if pos['ps'] in ('LONG', 'SHORT'):
+                    side = pos['ps'].lower()
+                else:
+                    side = 'long' if amount >= 0 else 'short'
+                symbol = self.symbol_for(pos['s'])
+                if pos['ps'] == 'BOTH' and amount != 0:
+                    # A one-way position can flip sides in one event; only the new side is open
+                    opposite = (symbol, 'short' if side == 'long' else 'long')
+                    changed = self.positions.pop(opposite, None) is not None or changed
+                if amount == 0:
+                    # One-way mode reports a closed position without its former side
+                    closed = [key for key in self.positions if key[0] == symbol and (pos['ps'] == 'BOTH' or key[1] == side)]
+                    for key in closed:
+                        del self.positions[key]
+                    changed = changed or bool(closed)
+                else:
+                    changed = self.update_position(symbol, side, abs(amount), float(pos['ep']), float(pos['up'])) or changed
+        elif event.get('e') == 'ACCOUNT_CONFIG_UPDATE' and 'ac' in event:
+            changed = self.set_leverage(self.symbol_for(event['ac']['s']), float(event['ac']['l']))
+        return changed
+
+    def apply_bybit(self, message):
+        changed = False
+        if message.get('topic') == 'wallet':
+            for wallet in message['data']:
+                for coin in wallet.get('coin', []):
+                    if coin['coin'] == 'USDT' and float(coin['walletBalance']) != self.total_balance:
+                        self.total_balance = float(coin['walletBalance'])
+                        changed = True
+        elif message.get('topic') == 'position':
+            for pos in message['data']:
+                symbol = self.symbol_for(pos['symbol'])
+                size = float(pos['size'] or 0)
+                hedge_side = BYBIT_HEDGE_SIDES.get(int(pos.get('positionIdx') or 0))
+                if size == 0:
+                    # A closed hedge-mode side leaves the other side open; a closed one-way position reports no side
+                    closed = [key for key in self.positions if key[0] == symbol and (hedge_side is None or key[1] == hedge_side)]
+                    for key in closed:
+                        del self.positions[key]
+                    changed = changed or bool(closed)
+                    continue
+                side = hedge_side or ('long' if pos['side'] == 'Buy' else 'short')
+                if hedge_side is None:
+                    # A one-way position can flip sides in one update; only the new side is open
+                    opposite = (symbol, 'short' if side == 'long' else 'long')
+                    changed = self.positions.pop(opposite, None) is not None or changed
+                changed = self.update_position(symbol, side, size, float(pos['entryPrice']), float(pos['unrealisedPnl'] or 0),
+                                               float(pos['leverage']) if pos.get('leverage') else None) or changed
+        return changed
+
+    def unrealized_pnl(self):
+        return sum(position['upnl'] or 0 for position in self.positions.values())
+
+def write_stream_state(db_conn, state):
+    # Only balance and uPnL come from the stream; _30day_gain is left to the refresh
+    try:
+        with db_lock:
+            db_conn.execute('''INSERT INTO account_data (account_name, total_balance, unrealized_pnl)
+                               VALUES (?, ?, ?)
+                               ON CONFLICT(account_name)
+                               DO UPDATE SET total_balance=excluded.total_balance, unrealized_pnl=excluded.unrealized_pnl''',
+                            (state.account_name, state.total_balance, state.unrealized_pnl()))
+            db_conn.commit()
+    except sqlite3.Error as e:
+        print(f'Failed to update database for {state.account_name}: {e}')
+        return
+
+    daily_pnl_by_coin = ledger_pnl(db_conn, state.account_name, utc_midnight_ms())['pnl_by_coin']
+    accounts_coins_data = [dict(position, daily_realized_pnl=daily_pnl_by_coin.get(state.market_id(position['symbol']), 0))
+                           for position in state.positions.values()]
+    # The stablesail_db helpers exit on a failed write; here that only skips this update, the next one retries
+    try:
+        if stablesail_db.mirror_positions:
+            # One lock hold, so a failed write rolls back only this account's mirrored rows
+            with db_lock:
+                try:
+                    write_account_coins_file(state.account_name, accounts_coins_data, db_conn)
+                    db_conn.commit()
+                except BaseException:
+                    db_conn.rollback()
+                    raise
+        else:
+            write_account_coins_file(state.account_name, accounts_coins_data)
+    except SystemExit as e:
+        print(f'Writing positions for {state.account_name} failed with error code {e.code}.')
+
+async def keep_listen_key_alive(api_key):
+    while True:
+        await asyncio.sleep(LISTEN_KEY_KEEPALIVE_SECONDS)
+        await asyncio.to_thread(send_request, 'binance', 'PUT', '/fapi/v1/listenKey', api_key=api_key, headers={'X-MBX-APIKEY': api_key})
+
+async def stream_binance(state, db_conn, ws_url):
+    api_key = state.exchange.apiKey
+    while True:
+        try:
+            response = await asyncio.to_thread(send_request, 'binance', 'POST', '/fapi/v1/listenKey', api_key=api_key, headers={'X-MBX-APIKEY': api_key})
+            async with websockets.connect(f"{ws_url}/{response['listenKey']}") as websocket:
+                keepalive = asyncio.create_task(keep_listen_key_alive(api_key))
+                try:
+                    async for message in websocket:
+                        event = json.loads(message)
+                        if event.get('e') == 'listenKeyExpired':
+                            break
+                        if state.apply_binance(event):
+                            await asyncio.to_thread(write_stream_state, db_conn, state)
+                finally:
+                    keepalive.cancel()
+        except (websockets.ConnectionClosed, OSError, KeyError) as e:
+            print(f'Binance stream for {state.account_name} interrupted: {e}')
+        except Exception as e:
+            # Handshake rejections, bad messages and the like only restart this account's stream
+            print(f'Binance stream for {state.account_name} failed: {e!r}')
+        await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+async def ping_bybit(websocket):
+    while True:
+        await asyncio.sleep(BYBIT_PING_SECONDS)
+        await websocket.send(json.dumps({'op': 'ping'}))
+
+async def stream_bybit(state, db_conn, ws_url):
+    while True:
+        try:
+            async with websockets.connect(ws_url) as websocket:
+                expires = int(time.time() * 1000) + BYBIT_AUTH_EXPIRY_MS
+                signature = hmac_sha256(state.exchange.secret, f'GET/realtime{expires}')
+                await websocket.send(json.dumps({'op': 'auth', 'args': [state.exchange.apiKey, expires, signature]}))
+                await websocket.send(json.dumps({'op': 'subscribe', 'args': ['position', 'wallet']}))
+                pinger = asyncio.create_task(ping_bybit(websocket))
+                try:
+                    async for message in websocket:
+                        message = json.loads(message)
+                        if message.get('op') == 'auth' and not message.get('success'):
+                            print(f"Bybit stream authentication failed for {state.account_name}: {message.get('ret_msg')}")
+                            break
+                        if state.apply_bybit(message):
+                            await asyncio.to_thread(write_stream_state, db_conn, state)
+                finally:
+                    pinger.cancel()
+        except (websockets.ConnectionClosed, OSError) as e:
+            print(f'Bybit stream for {state.account_name} interrupted: {e}')
+        except Exception as e:
+            # Handshake rejections, bad messages and the like only restart this account's stream
+            print(f'Bybit stream for {state.account_name} failed: {e!r}')
+        await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+async def load_snapshot(state, db_conn):
+    # A failing account (e.g. a bad key) retries on its own without holding up the others
+    while True:
+        try:
+            await asyncio.to_thread(state.load_snapshot)
+            await asyncio.to_thread(write_stream_state, db_conn, state)
+            return
+        except (Exception, SystemExit) as e:
+            print(f'Snapshot for {state.account_name} failed: {e!r}')
+        await asyncio.sleep(SNAPSHOT_RETRY_SECONDS)
+
+async def run_account(state, db_conn, ws_url, load_snapshots):
+    if load_snapshots:
+        await load_snapshot(state, db_conn)
+    stream = stream_binance if state.exchange.id == 'binance' else stream_bybit
+    await stream(state, db_conn, ws_url)
+
+async def run_streams(exchanges, db_conn, ws_urls, load_snapshots=True):
+    tasks = [asyncio.create_task(run_account(AccountState(account_name, exchange), db_conn, ws_urls[exchange.id], load_snapshots))
+             for account_name, exchange in exchanges]
+    print(f'Streaming accounts: {len(tasks)}.')
+    await asyncio.gather(*tasks)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stream positions and balances from exchange user-data websockets.')
+    parser.add_argument('--account', type=str, help='Specific account to stream. Streams all if not specified.')
+    parser.add_argument('--binance_ws_url', default=BINANCE_WS_URL, help='Binance user-data stream base URL.')
+    parser.add_argument('--bybit_ws_url', default=BYBIT_WS_URL, help='Bybit private stream URL.')
+    parser.add_argument('--binance_rest_url', default=exchange_http.BASE_URLS['binance'], help='Binance futures REST base URL used for listen keys.')
+    parser.add_argument('--mirror_positions', action='store_true', help='Also write every account\'s positions to the account_positions table.')
+    parser.add_argument('--skip_snapshot', action='store_true', help='Do not load balances, positions and markets over REST before streaming.')
+    args = parser.parse_args(argv)
+
+    exchange_http.BASE_URLS['binance'] = args.binance_rest_url
+    stablesail_db.mirror_positions = args.mirror_positions
+
+    db_conn = init_db()
+    exchanges = fetch_exchange_data(load_api_keys(args.account), args.account)
+    ws_urls = {'binance': args.binance_ws_url, 'bybit': args.bybit_ws_url}
+    try:
+        asyncio.run(run_streams(exchanges, db_conn, ws_urls, load_snapshots=not args.skip_snapshot))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db_conn.close()
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f'An unexpected error occurred: {e}')
+        sys.exit(ERROR_CODES['generic'])
@@ -0,0 +1,59 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import botconfigmanager
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        # Configuration files live in the current directory
+        self.workdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.workdir.name)
+        for username in ('alice', 'bob'):
+            self.run_main('--user', username)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.workdir.cleanup()
+
+    def run_main(self, *argv):
+        saved_argv = sys.argv
+        sys.argv = ['botconfigmanager.py', *argv]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                botconfigmanager.main()
+        except SystemExit as e:
+            return e.code
+        finally:
+            sys.argv = saved_argv
+
+    def read_json(self, path):
+        with open(path) as file:
+            return json.load(file)
+
+    def test_every_write_keeps_the_store_current(self):
+        self.assertEqual(self.run_main('--users', '*', '--store', botconfigmanager.STORE_FILE), 1)
+        self.assertEqual(self.run_main('--user', 'alice', '--parameter', 'leverage', '--value', '1.5'), 0)
+        self.assertEqual(self.run_main('--user', 'carol'), 0)
+
+        store = self.read_json(botconfigmanager.STORE_FILE)
+        self.assertEqual(sorted(store), ['alice', 'bob', 'carol'])
+        self.assertEqual(store['alice']['leverage'], 1.5)
+
+    def test_names_are_checked_against_each_users_file(self):
+        config = self.read_json(botconfigmanager.get_user_config_path('bob'))
+        del config['xgboost']
+        with open(botconfigmanager.get_user_config_path('bob'), 'w') as file:
+            json.dump(config, file)
+
+        self.assertEqual(self.run_main('--users', '*', '--set', 'xgboost=1.5'), 2)
+        self.assertEqual(self.read_json(botconfigmanager.get_user_config_path('alice'))['xgboost'], 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import stablesail_db
+import stablesail_stream
+
+class FakeExchange:
+    # Just enough of a ccxt exchange for AccountState without loaded markets
+    id = 'bybit'
+    markets = None
+
+def make_state(account_name):
+    state = stablesail_stream.AccountState(account_name, FakeExchange())
+    state.total_balance = 100.0
+    state.update_position('BTCUSDT', 'long', 1.0, 50000.0, 5.0, 10.0)
+    return state
+
+class WriteFailureTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        folder = self.workdir.name
+        self.saved = (stablesail_db.maindb_file, stablesail_db.accounts_coins_file_template, stablesail_db.mirror_positions)
+        stablesail_db.maindb_file = os.path.join(folder, 'website_data.db')
+        stablesail_db.accounts_coins_file_template = os.path.join(folder, '{username}_account_coins.json')
+        stablesail_db.mirror_positions = True
+        self.db_conn = stablesail_db.init_db()
+        # The coins file of this account goes to a folder that doesn't exist, so writing it fails
+        self.bad_state = make_state(os.path.join('missing', 'bad'))
+        self.good_state = make_state('good')
+
+    def tearDown(self):
+        self.db_conn.close()
+        stablesail_db.maindb_file, stablesail_db.accounts_coins_file_template, stablesail_db.mirror_positions = self.saved
+        self.workdir.cleanup()
+
+    def coins_file(self, account_name):
+        return stablesail_db.accounts_coins_file_template.format(username=account_name)
+
+    def mirrored_accounts(self):
+        return {row[0] for row in self.db_conn.execute('SELECT DISTINCT account_name FROM account_positions')}
+
+    def test_failed_write_does_not_exit(self):
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            stablesail_stream.write_stream_state(self.db_conn, self.bad_state)
+        self.assertIn('failed with error code', stdout.getvalue())
+        # The failed account's mirrored positions are rolled back with it
+        self.assertEqual(self.mirrored_accounts(), set())
+
+    def test_other_streams_keep_running(self):
+        async def stream_once(state, db_conn, ws_url):
+            await asyncio.to_thread(stablesail_stream.write_stream_state, db_conn, state)
+
+        saved_stream = stablesail_stream.stream_bybit
+        stablesail_stream.stream_bybit = stream_once
+        try:
+            async def run_both():
+                await asyncio.gather(stablesail_stream.run_account(self.bad_state, self.db_conn, '', False),
+                                     stablesail_stream.run_account(self.good_state, self.db_conn, '', False))
+            with contextlib.redirect_stdout(io.StringIO()):
+                asyncio.run(run_both())
+        finally:
+            stablesail_stream.stream_bybit = saved_stream
+
+        with open(self.coins_file('good')) as file:
+            self.assertEqual([position['symbol'] for position in json.load(file)], ['BTCUSDT'])
+        self.assertEqual(self.mirrored_accounts(), {'good'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config_loader
+import userconfigmanager
+
+MASTER_YAML = """- user: accountname
+  symbols: [BTCUSDT]
+  config: configs/btc.json
+"""
+
+CONFIG_YAML = """instances:
+- user: u0
+  symbols: [ETHUSDT]
+- user: u1
+  symbols: [XRPUSDT]
+"""
+
+class BulkOperationsTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        folder = self.workdir.name
+        self.saved = (userconfigmanager.MASTER_YAML_FOLDER, userconfigmanager.CONFIG_YAML, config_loader.CACHE_FOLDER)
+        userconfigmanager.MASTER_YAML_FOLDER = folder + os.sep
+        userconfigmanager.CONFIG_YAML = os.path.join(folder, 'config.yaml')
+        config_loader.CACHE_FOLDER = os.path.join(folder, 'cache')
+        for name, content in (('master.yaml', MASTER_YAML), ('config.yaml', CONFIG_YAML), ('broken.yaml', '- [unclosed\n')):
+            with open(os.path.join(folder, name), 'w') as file:
+                file.write(content)
+
+    def tearDown(self):
+        userconfigmanager.MASTER_YAML_FOLDER, userconfigmanager.CONFIG_YAML, config_loader.CACHE_FOLDER = self.saved
+        self.workdir.cleanup()
+
+    def run_bulk(self, lines):
+        source = os.path.join(self.workdir.name, 'operations.txt')
+        with open(source, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        stdout, stderr = io.StringIO(), io.StringIO()
+        code = 0
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                userconfigmanager.bulk_operations(source)
+            except SystemExit as e:
+                code = e.code
+        return code, stdout.getvalue(), stderr.getvalue()
+
+    def users(self):
+        return [config['user'] for config in config_loader.read_yaml(userconfigmanager.CONFIG_YAML)['instances']]
+
+    def test_bad_master_file_fails_only_its_line(self):
+        code, stdout, stderr = self.run_bulk(['add n1', 'reset u0', 'add n2 nosuch.yaml', 'reset u1 broken.yaml', 'delete u1'])
+        self.assertEqual(code, 1)
+        self.assertIn("Master file 'nosuch.yaml' could not be read. (code 1)", stderr)
+        self.assertIn("Master file 'broken.yaml' could not be read. (code 2)", stderr)
+        self.assertIn('Bulk operations: 3 succeeded, 2 failed.', stdout)
+        self.assertEqual(self.users(), ['n1', 'u0'])
+
+    def test_failed_reset_keeps_the_user(self):
+        code, _, _ = self.run_bulk(['reset u0 nosuch.yaml'])
+        self.assertEqual(code, 1)
+        self.assertEqual(self.users(), ['u0', 'u1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ import argparse
 from datetime import datetime
 import sys
 import os
+from config_loader import read_yaml, write_yaml
 
 # Constants for file paths
 MASTER_YAML_FOLDER = '/home/stablesail/botcode/configtemplates/'
@@ -12,39 +13,36 @@ DEFAULT_MASTER_FILE = 'master.yaml'
 def current_datetime():
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-def read_yaml(file_path):
-    try:
-        with open(file_path, 'r') as file:
-            return yaml.safe_load(file)
-    except FileNotFoundError:
-        print(f"Error: File '{file_path}' not found.", file=sys.stderr)
-        sys.exit(1)
-    except yaml.YAMLError as e:
-        print(f"Error parsing YAML file '{file_path}': {e}", file=sys.stderr)
-        sys.exit(2)
+def master_user_configs(master_file_name):
+    master_data = read_yaml(os.path.join(MASTER_YAML_FOLDER, master_file_name))
+    return [data for data in master_data if data.get('user') == "accountname"]
 
-def write_yaml(data, file_path):
+def load_master_configs(master_file_name):
+    # Returns (exit code, message, configs); a master file that can't be read fails only the operation using it
     try:
-        with open(file_path, 'w') as file:
-            yaml.dump(data, file, sort_keys=False)
-    except Exception as e:
-        print(f"Error writing to '{file_path}': {e}", file=sys.stderr)
-        sys.exit(3)
+        return 0, None, master_user_configs(master_file_name)
+    except SystemExit as e:
+        return e.code, f"Master file '{master_file_name}' could not be read.", None
 
-def find_user(account_name, config_data):
-    for user in config_data.get('instances', []):
-        if user and user.get('user') == account_name:
-            return user
-    return None
+def group_instances_by_user(config_data):
+    user_configs = {}
+    for config in config_data.get('instances', []):
+        if config:
+            user_configs.setdefault(config.get('user'), []).append(config)
+    return user_configs
 
-def add_user(account_name, master_file_name=DEFAULT_MASTER_FILE, isreset=False):
-    config_data = read_yaml(CONFIG_YAML) or {'instances': []}
-    if find_user(account_name, config_data):
-        print(f"User '{account_name}' already exists.", file=sys.stderr)
-        sys.exit(4)
+def start_edit(config_data):
+    # The by-user index is only for lookups; config.yaml keeps its order, deleted users are filtered out
+    # and added users appended when the edit is applied
+    return {'users': group_instances_by_user(config_data), 'deleted': set(), 'added': []}
 
-    master_data = read_yaml(os.path.join(MASTER_YAML_FOLDER, master_file_name))
-    new_user_data = [data for data in master_data if data.get('user') == "accountname"]
+def apply_edit(config_data, edit):
+    instances = [config for config in config_data.get('instances') or [] if not (config and config.get('user') in edit['deleted'])]
+    config_data['instances'] = instances + edit['added']
+
+# The operations below change an edit in memory and return (exit code, message);
+# callers apply it and write config.yaml once afterwards
+def add_configs(edit, account_name, new_user_data, isreset=False):
     for data in new_user_data:
         data['user'] = account_name
         if not isreset:
@@ -52,32 +50,118 @@ def add_user(account_name, master_file_name=DEFAULT_MASTER_FILE, isreset=False):
         else:
             data['updated_at'] = current_datetime()
 
-    config_data['instances'].extend(new_user_data)
-    write_yaml(config_data, CONFIG_YAML)
-    print(f"User '{account_name}' added successfully.")
+    edit['users'][account_name] = new_user_data
+    edit['added'].extend(new_user_data)
 
-def delete_user(account_name):
-    config_data = read_yaml(CONFIG_YAML)
-    if not find_user(account_name, config_data):
-        print(f"User '{account_name}' not found.", file=sys.stderr)
-        sys.exit(5)
+def apply_add(edit, account_name, master_file_name=DEFAULT_MASTER_FILE):
+    if account_name in edit['users']:
+        return 4, f"User '{account_name}' already exists."
+
+    code, message, new_user_data = load_master_configs(master_file_name)
+    if code:
+        return code, message
+    add_configs(edit, account_name, new_user_data)
+    return 0, f"User '{account_name}' added successfully."
 
-    config_data['instances'] = [user for user in config_data.get('instances', []) if user.get('user') != account_name]
+def apply_delete(edit, account_name):
+    if account_name not in edit['users']:
+        return 5, f"User '{account_name}' not found."
+
+    del edit['users'][account_name]
+    edit['deleted'].add(account_name)
+    edit['added'] = [config for config in edit['added'] if config.get('user') != account_name]
+    return 0, f"User '{account_name}' deleted successfully."
+
+def apply_reset(edit, account_name, master_file_name=DEFAULT_MASTER_FILE):
+    if account_name not in edit['users']:
+        return 6, f"User '{account_name}' does not exist and cannot be reset."
+
+    # The master file is read before the user is deleted, so a bad template leaves the user as it was
+    code, message, new_user_data = load_master_configs(master_file_name)
+    if code:
+        return code, message
+
+    # Reports what the separate delete and add steps used to print
+    _, deleted = apply_delete(edit, account_name)
+    add_configs(edit, account_name, new_user_data, isreset=True)
+    return 0, f"{deleted}\nUser '{account_name}' added successfully."
+
+OPERATIONS = {
+    'add': apply_add,
+    'delete': lambda edit, account_name, master_file_name: apply_delete(edit, account_name),
+    'reset': apply_reset,
+}
+
+def run_operation(operation, account_name, master_file_name=DEFAULT_MASTER_FILE):
+    config_data = read_yaml(CONFIG_YAML) or {'instances': []}
+    edit = start_edit(config_data)
+    code, message = OPERATIONS[operation](edit, account_name, master_file_name)
+    if code:
+        print(message, file=sys.stderr)
+        sys.exit(code)
+
+    apply_edit(config_data, edit)
     write_yaml(config_data, CONFIG_YAML)
-    print(f"User '{account_name}' deleted successfully.")
+    print(message)
+
+def add_user(account_name, master_file_name=DEFAULT_MASTER_FILE):
+    run_operation('add', account_name, master_file_name)
+
+def delete_user(account_name):
+    run_operation('delete', account_name)
 
 def reset_user(account_name, master_file_name=DEFAULT_MASTER_FILE):
-    config_data = read_yaml(CONFIG_YAML)
-    existing_user = find_user(account_name, config_data)
-    if not existing_user:
-        print(f"User '{account_name}' does not exist and cannot be reset.", file=sys.stderr)
-        sys.exit(6)
+    run_operation('reset', account_name, master_file_name)
 
-    delete_user(account_name)
-    add_user(account_name, master_file_name, isreset=True)
+def read_bulk_operations(source):
+    # One operation per line: <add|delete|reset> <account> [master file]; blank lines and # comments are skipped
+    try:
+        file = sys.stdin if source == '-' else open(source, 'r')
+    except FileNotFoundError:
+        print(f"Error: File '{source}' not found.", file=sys.stderr)
+        sys.exit(1)
+    with file:
+        lines = file.read().splitlines()
+
+    operations = []
+    for line_number, line in enumerate(lines, 1):
+        fields = line.split('#', 1)[0].split()
+        if fields:
+            operations.append((line_number, fields))
+    return operations
+
+def bulk_operations(source, default_master_file_name=DEFAULT_MASTER_FILE):
+    config_data = read_yaml(CONFIG_YAML) or {'instances': []}
+    edit = start_edit(config_data)
+
+    failed_codes = []
+    applied = 0
+    for line_number, fields in read_bulk_operations(source):
+        if fields[0] not in OPERATIONS or len(fields) not in (2, 3):
+            code, message = 7, f"Line {line_number}: invalid operation '{' '.join(fields)}'."
+        else:
+            master_file_name = fields[2] if len(fields) == 3 else default_master_file_name
+            code, message = OPERATIONS[fields[0]](edit, fields[1], master_file_name)
+
+        if code:
+            print(f"{message} (code {code})", file=sys.stderr)
+            failed_codes.append(code)
+        else:
+            print(message)
+            applied += 1
+
+    # Successful operations are written even when others failed, in a single write
+    if applied:
+        apply_edit(config_data, edit)
+        write_yaml(config_data, CONFIG_YAML)
+    print(f"Bulk operations: {applied} succeeded, {len(failed_codes)} failed.")
+    if failed_codes:
+        sys.exit(failed_codes[0])
 
-def list_users():
-    config_data = read_yaml(CONFIG_YAML)
+def list_users(config_data=None):
+    # config_data can be passed in by callers that already hold config.yaml, like config_service.py
+    if config_data is None:
+        config_data = read_yaml(CONFIG_YAML)
     user_symbol_counts = {}
 
     # Aggregate symbol counts for each user
@@ -94,50 +178,77 @@ def list_users():
     for user_name, symbol_count in user_symbol_counts.items():
         print(f"User: {user_name} - Symbols: {symbol_count}")
 
-def configs_match(master_config, user_config):
-    for key, master_value in master_config.items():
-        # Skip user comparison directly; focus on configurations
-        if key == 'user': continue
-
-        # Ensure the key exists in the user configuration
-        if key not in user_config:
-            return False
-        
-        user_value = user_config[key]
-        
-        # Special handling for lists: compare as sets for order-independent comparison
-        if isinstance(master_value, list) and isinstance(user_value, list):
-            if set(master_value) != set(user_value):
-                return False
-        # Direct comparison for other types
-        elif master_value != user_value:
-            return False
-    return True
-
-def all_master_configs_present(master_configs, user_configs):
-    # Check if all master configs are matched in the user's configs
-    return all(any(configs_match(m_config, u_config) for u_config in user_configs) for m_config in master_configs)
-
-def list_matching_users(master_file_name=DEFAULT_MASTER_FILE):
-    master_data = read_yaml(os.path.join(MASTER_YAML_FOLDER, master_file_name))
-    config_data = read_yaml(CONFIG_YAML)
+def freeze(value):
+    # Hashable form of a YAML value; nested lists keep their order, as == compares them
+    if isinstance(value, dict):
+        return frozenset((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def config_fingerprint(config, keys):
+    # Values of the given keys; top-level lists are compared as sets, order-independent
+    # Returns None when the config lacks one of the keys
+    fingerprint = []
+    for key in keys:
+        if key not in config:
+            return None
+        value = config[key]
+        if isinstance(value, list):
+            fingerprint.append((key, frozenset(freeze(item) for item in value)))
+        else:
+            fingerprint.append((key, freeze(value)))
+    return tuple(fingerprint)
+
+def master_key_sets(master_configs):
+    # The compared keys of each master entry; 'user' is skipped, focus on configurations
+    return [tuple(sorted(key for key in config if key != 'user')) for config in master_configs]
+
+def missing_master_configs(master_fingerprints, user_configs):
+    # Indexes of the master entries none of the user's configs match
+    present = set()
+    for keys in {keys for keys, _ in master_fingerprints}:
+        for config in user_configs:
+            fingerprint = config_fingerprint(config, keys)
+            if fingerprint is not None:
+                present.add((keys, fingerprint))
+    return [index for index, entry in enumerate(master_fingerprints) if entry not in present]
+
+def describe_config(config):
+    return yaml.safe_dump({key: value for key, value in config.items() if key != 'user'}, default_flow_style=True, sort_keys=False).strip()
+
+def list_matching_users(master_file_name=DEFAULT_MASTER_FILE, config_data=None, master_data=None, show_missing=False):
+    if master_data is None:
+        master_data = read_yaml(os.path.join(MASTER_YAML_FOLDER, master_file_name))
+    if config_data is None:
+        config_data = read_yaml(CONFIG_YAML)
 
     # Filter configurations for 'accountname' in master_data
     master_configs = [config for config in master_data if config.get('user') == 'accountname']
+    master_fingerprints = [(keys, config_fingerprint(config, keys)) for config, keys in zip(master_configs, master_key_sets(master_configs))]
 
-    # Iterate through config_data 'instances', comparing configurations
+    # Group the instances by user once, then check each user's configs against all master entries
     matching_users = []
-    for config in config_data.get('instances', []):
-        user = config.get('user')
-        user_configs = [c for c in config_data.get('instances', []) if c.get('user') == user]
-
-        if all_master_configs_present(master_configs, user_configs):
+    missing_by_user = {}
+    for user, user_configs in group_instances_by_user(config_data).items():
+        missing = missing_master_configs(master_fingerprints, user_configs)
+        if missing:
+            missing_by_user[user] = missing
+        else:
             matching_users.append(user)
 
     print("Matching Users:")
-    for user in set(matching_users):  # Ensure uniqueness
+    for user in matching_users:
         print(user)
 
+    # The missing entries are only listed on request, so the default output stays a plain list of users
+    if show_missing and missing_by_user:
+        print("Non-matching Users:")
+        for user, missing in missing_by_user.items():
+            print(f"{user} - missing {len(missing)} of {len(master_configs)} master entries:")
+            for index in missing:
+                print(f"  #{index + 1}: {describe_config(master_configs[index])}")
+
 def main():
     parser = argparse.ArgumentParser(description="Manage YAML User Configurations")
     parser.add_argument('-a', '--account', help="Account name")
@@ -147,19 +258,23 @@ def main():
     parser.add_argument('--reset_user', action='store_true', help="Reset user data to master configuration")
     parser.add_argument('--list_users', action='store_true', help="List all users and their symbol counts")
     parser.add_argument('--list_matching_users', action='store_true', help="List users matching the master configuration")
+    parser.add_argument('--show_missing', action='store_true', help="With --list_matching_users, also list non-matching users and the master entries they miss")
+    parser.add_argument('--bulk', metavar='FILE', help="Apply add/delete/reset operations listed in FILE ('-' for stdin) with a single write")
 
     args = parser.parse_args()
 
     if args.add_user and args.account:
-        add_user(args.account, args.master_file_name, isreset=False)
+        add_user(args.account, args.master_file_name)
     elif args.delete_user and args.account:
         delete_user(args.account)
     elif args.reset_user and args.account:
         reset_user(args.account, args.master_file_name)
+    elif args.bulk:
+        bulk_operations(args.bulk, args.master_file_name)
     elif args.list_users:
         list_users()
     elif args.list_matching_users:
-        list_matching_users(args.master_file_name)
+        list_matching_users(args.master_file_name, show_missing=args.show_missing)
     else:
         parser.print_help()
 
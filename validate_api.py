@@ -1,8 +1,56 @@
-import ccxt
 import argparse
+import hashlib
+import json
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import market_cache
+from rate_limiter import call_ccxt
+
+# Keys checked in parallel per exchange in bulk mode
+VALIDATE_WORKERS = {
+    'binance': 4,
+    'bybit': 4,
+}
+
+# How long a verdict is reused before the key is checked again; failures are rechecked sooner
+VERDICT_TTL_SECONDS = {
+    200: 15 * 60,
+    401: 60,
+    403: 60,
+}
+VERDICTS_CACHE_NAME = 'api_verdicts'
+
+def verdict_key(api_key, api_secret, exchange_name):
+    # Only a hash of the credentials is stored
+    return hashlib.sha256(f'{exchange_name.lower()}:{api_key}:{api_secret}'.encode()).hexdigest()
+
+def load_verdicts():
+    try:
+        with open(market_cache.cache_path(VERDICTS_CACHE_NAME), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_verdicts(new_verdicts):
+    # Re-read first so verdicts stored by other runs in the meantime are kept
+    verdicts = load_verdicts()
+    now = time.time()
+    verdicts = {key: verdict for key, verdict in verdicts.items() if verdict['checked_at'] + VERDICT_TTL_SECONDS[verdict['code']] > now}
+    verdicts.update(new_verdicts)
+    market_cache.write_cache(VERDICTS_CACHE_NAME, verdicts)
+
+def cached_verdict(verdicts, key):
+    verdict = verdicts.get(key)
+    if verdict and verdict['checked_at'] + VERDICT_TTL_SECONDS[verdict['code']] > time.time():
+        return verdict['code'], verdict['message']
+    return None
+
+def check_api(api_key, api_secret, exchange_name):
+    # Imported here so --help doesn't pay for loading every ccxt exchange
+    import ccxt
 
-def verify_api(api_key, api_secret, exchange_name):
     try:
         # Create the exchange object
         exchange_class = getattr(ccxt, exchange_name.lower())
@@ -12,37 +60,120 @@ def verify_api(api_key, api_secret, exchange_name):
             'enableRateLimit': True,  # Required for Binance
         })
 
-        # Fetch the account balance
+        # Fetch the account balance; markets are shared between keys and runs
         if exchange_name.lower() == 'binance':
-            balance = exchange.fetch_balance(params={'type': 'future'})
+            market_cache.load_markets(exchange)
+            balance = call_ccxt(exchange, 'fetch_balance', params={'type': 'future'})
         elif exchange_name.lower() == 'bybit':
-            balance = exchange.fetch_balance(params={'type': 'CONTRACT'})
+            market_cache.load_markets(exchange)
+            balance = call_ccxt(exchange, 'fetch_balance', params={'type': 'CONTRACT'})
         else:
-            print('Invalid exchange name')
-            sys.exit(400)
+            return 400, 'Invalid exchange name'
 
         if balance:
-            print('API key is valid and account is open for trading')
-            sys.exit(200)
+            return 200, 'API key is valid and account is open for trading'
         else:
-            print('API key is valid but account is not open for trading')
-            sys.exit(401)
+            return 401, 'API key is valid but account is not open for trading'
 
     except ccxt.AuthenticationError:
-        print('Invalid API key or secret')
-        sys.exit(403)
-    except ccxt.ExchangeError as e:
-        print(f'Error: {e}')
-        sys.exit(500)
+        return 403, 'Invalid API key or secret'
+    except ccxt.BaseError as e:
+        return 500, f'Error: {e}'
     except AttributeError as e:
-        print(f'Error: {e}. Did you mean: "bybit"?')
+        return 400, f'Error: {e}. Did you mean: "bybit"?'
+
+def check_api_cached(api_key, api_secret, exchange_name, verdicts, use_cache=True):
+    key = verdict_key(api_key, api_secret, exchange_name)
+    cached = cached_verdict(verdicts, key) if use_cache else None
+    if cached:
+        return cached, {}
+    code, message = check_api(api_key, api_secret, exchange_name)
+    new_verdict = {key: {'code': code, 'message': message, 'checked_at': time.time()}} if code in VERDICT_TTL_SECONDS else {}
+    return (code, message), new_verdict
+
+def verify_api(api_key, api_secret, exchange_name, use_cache=True):
+    (code, message), new_verdict = check_api_cached(api_key, api_secret, exchange_name, load_verdicts(), use_cache)
+    if new_verdict:
+        save_verdicts(new_verdict)
+    print(message)
+    sys.exit(code)
+
+def read_bulk_keys(source):
+    # Either an api-keys.json style file, or lines of '<exchange> <api_key> <api_secret> [name]'
+    try:
+        file = sys.stdin if source == '-' else open(source, 'r')
+    except FileNotFoundError:
+        print(f"Error: File '{source}' not found.")
         sys.exit(400)
+    with file:
+        content = file.read()
+
+    try:
+        data = json.loads(content)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        # An entry missing a field is reported as that entry's 400; the other keys are still checked
+        keys = []
+        for name, api in data.items():
+            missing = [field for field in ('exchange', 'key', 'secret') if not isinstance(api, dict) or field not in api]
+            if missing:
+                keys.append((name, api.get('exchange', '') if isinstance(api, dict) else '', None, None, f"Missing {', '.join(missing)}"))
+            else:
+                keys.append((name, api['exchange'], api['key'], api['secret'], None))
+        return keys
+
+    keys = []
+    for line in content.splitlines():
+        fields = line.split('#', 1)[0].split()
+        if len(fields) in (3, 4):
+            keys.append((fields[3] if len(fields) == 4 else f'{fields[1][:6]}...', fields[0], fields[1], fields[2], None))
+        elif fields:
+            print(f"Error: Invalid line '{line.strip()}'.")
+            sys.exit(400)
+    return keys
+
+def verify_bulk(source, use_cache=True):
+    keys = read_bulk_keys(source)
+    verdicts = load_verdicts()
+
+    # One bounded pool per exchange; unknown exchanges fail fast without a request
+    executors = {}
+    futures = []
+    try:
+        for name, exchange_name, api_key, api_secret, error in keys:
+            if error:
+                futures.append((name, exchange_name, None, error))
+                continue
+            exchange_id = exchange_name.lower()
+            if exchange_id not in executors:
+                executors[exchange_id] = ThreadPoolExecutor(max_workers=VALIDATE_WORKERS.get(exchange_id, 1))
+            futures.append((name, exchange_name, executors[exchange_id].submit(check_api_cached, api_key, api_secret, exchange_name, verdicts, use_cache), None))
+
+        new_verdicts = {}
+        results = []
+        for name, exchange_name, future, error in futures:
+            (code, message), new_verdict = future.result() if future else ((400, error), {})
+            new_verdicts.update(new_verdict)
+            results.append(code)
+            print(f'{name} ({exchange_name}): {code} {message}')
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    if new_verdicts:
+        save_verdicts(new_verdicts)
+    valid = results.count(200)
+    print(f'Keys checked: {len(results)}, valid: {valid}, invalid: {len(results) - valid}.')
+    sys.exit(0 if valid == len(results) else 1)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Verify API key for futures trading')
-    parser.add_argument('-k', '--api_key', type=str, help='API key', required=True)
-    parser.add_argument('-s', '--api_secret', type=str, help='API secret', required=True)
-    parser.add_argument('-x', '--exchange_name', type=str, help='Exchange name (binance or bybit)', required=True)
+    parser.add_argument('-k', '--api_key', type=str, help='API key')
+    parser.add_argument('-s', '--api_secret', type=str, help='API secret')
+    parser.add_argument('-x', '--exchange_name', type=str, help='Exchange name (binance or bybit)')
+    parser.add_argument('--bulk', metavar='FILE', type=str, help="Check every key in this file ('-' for stdin): an api-keys.json file or lines of '<exchange> <key> <secret> [name]'")
+    parser.add_argument('--no_cache', action='store_true', help='Check with the exchange even if a recent verdict is cached')
     args = parser.parse_args()
 
     api_key = args.api_key
@@ -55,6 +186,10 @@ if __name__ == "__main__":
               "  401 - API key is valid but account is not open for trading\n"
               "  403 - Invalid API key or secret\n"
               "  500 - Error occurred during API request")
+    elif args.bulk:
+        verify_bulk(args.bulk, not args.no_cache)
+    elif not (api_key and api_secret and exchange_name):
+        parser.error('the following arguments are required: -k/--api_key, -s/--api_secret, -x/--exchange_name')
     else:
-        verify_api(api_key, api_secret, exchange_name)
+        verify_api(api_key, api_secret, exchange_name, not args.no_cache)
 